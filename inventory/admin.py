@@ -101,7 +101,7 @@ class TransactionAdmin(admin.ModelAdmin):
     list_display = ['product', 'transaction_type', 'quantity', 'reference', 'created_by', 'created_at']
     list_filter = ['transaction_type', 'created_at', 'created_by']
     search_fields = ['product__name', 'reference', 'notes']
-    readonly_fields = ['created_at']
+    readonly_fields = ['unit_cost', 'unit_price', 'created_at']
     date_hierarchy = 'created_at'
     
     def get_queryset(self, request):
@@ -6,3 +6,7 @@ class InventoryConfig(AppConfig):
     name = 'inventory'
     verbose_name = 'Inventory Management'
 
+
+    def ready(self):
+        # Register cache invalidation receivers
+        from . import signals  # noqa: F401
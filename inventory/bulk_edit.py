@@ -0,0 +1,63 @@
+"""
+Set-based product edits.
+
+A price or reorder-level change across many products is one UPDATE with
+the new value computed by the database, instead of loading and saving each
+product through ProductForm.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Value, BigIntegerField, DecimalField, IntegerField
+from django.db.models.functions import Cast, Greatest, Least, Round
+from django.utils import timezone
+
+from .models import Product, UserInventoryStats, MAX_INTEGER
+from .signals import mark_user_data_changed
+
+# Largest value of Product's DecimalField(max_digits=10, decimal_places=2)
+MAX_PRICE = Decimal('99999999.99')
+
+BULK_EDIT_FIELDS = ['cost_price', 'selling_price', 'reorder_level']
+
+
+def new_value_expression(field, change, value):
+    """
+    Expression for `field` changed by `value` percent (change='percent') or
+    by `value` itself (change='amount'), never below zero and capped to what
+    the column can hold. Prices are rounded to cents.
+    """
+    if field not in BULK_EDIT_FIELDS:
+        raise ValueError(f'Unsupported field "{field}"')
+    if field == 'reorder_level':
+        # Computed wider than the column and capped before it is stored
+        wide = BigIntegerField()
+        if change == 'percent':
+            expression = Round(F(field) * Value(1 + value / 100))
+        else:
+            expression = Cast(F(field), wide) + Value(int(value), output_field=wide)
+        expression = Least(Greatest(expression, Value(0), output_field=wide), Value(MAX_INTEGER), output_field=wide)
+        return Cast(expression, IntegerField())
+
+    price = DecimalField(max_digits=10, decimal_places=2)
+    if change == 'percent':
+        expression = Round(F(field) * Value(1 + value / 100), 2, output_field=price)
+    else:
+        expression = F(field) + Value(value, output_field=price)
+    return Least(Greatest(expression, Value(Decimal('0.00'))), Value(MAX_PRICE), output_field=price)
+
+
+def bulk_edit_products(products, user, field, change, value):
+    """
+    Apply a change to every product of `user` in the `products` queryset with
+    a single UPDATE. Returns the number of products changed.
+    """
+    products = Product.objects.filter(created_by=user, pk__in=products.order_by().values('pk'))
+    new_value = new_value_expression(field, change, value)
+    with transaction.atomic():
+        UserInventoryStats.record_update(products, **{field: new_value})
+        updated = products.update(**{field: new_value, 'updated_at': timezone.now()})
+    if updated:
+        # update() sends no signals; needs_reorder is recomputed by the database
+        mark_user_data_changed(user.pk)
+    return updated
@@ -0,0 +1,49 @@
+"""
+Per-user caching of derived inventory data (dashboard numbers and charts).
+
+Cached values are keyed by a per-user generation number. Any write to the
+user's inventory bumps the generation (see signals.py), so entries built
+from older data are simply never read again and expire on their own.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+def _generation_key(user_id):
+    return f'inventory:generation:{user_id}'
+
+
+def _new_generation():
+    # Time based so a generation lost to eviction never repeats an old one
+    return time.time_ns()
+
+
+def get_generation(user_id):
+    """Current cache generation for a user"""
+    return cache.get_or_set(_generation_key(user_id), _new_generation, None)
+
+
+def bump_generation(user_id):
+    """Invalidate everything cached for a user"""
+    key = _generation_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Not cached (never read or evicted) - start a fresh generation
+        cache.set(key, _new_generation(), None)
+
+
+def cached_for_user(user_id, name, builder, timeout=None):
+    """
+    Return the cached value `name` for a user, calling builder() on a miss.
+    """
+    if timeout is None:
+        timeout = settings.DASHBOARD_CACHE_TIMEOUT
+    key = f'inventory:{name}:{user_id}:{get_generation(user_id)}'
+    value = cache.get(key)
+    if value is None:
+        value = builder()
+        cache.set(key, value, timeout)
+    return value
@@ -0,0 +1,205 @@
+"""
+Streaming CSV and XLSX exports.
+
+Rows are read with .iterator() (a server-side cursor on PostgreSQL) and
+encoded as they are produced, so memory use stays flat however many rows a
+user has. The XLSX writer streams a minimal workbook through zipfile with
+inline strings, so it never needs the whole sheet in memory either.
+"""
+import csv
+import re
+import zipfile
+from datetime import datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.utils import timezone
+
+from .importers import FORMULA_PREFIXES, TRANSACTION_COLUMNS
+from .models import Product, Transaction, TransactionArchive
+
+ITERATOR_CHUNK_SIZE = 2000
+
+
+def _local(value):
+    return timezone.localtime(value).strftime('%Y-%m-%d %H:%M:%S') if value else ''
+
+
+PRODUCT_EXPORT_COLUMNS = [
+    ('id', lambda p: p.pk),
+    ('sku', lambda p: p.sku),
+    ('name', lambda p: p.name),
+    ('description', lambda p: p.description),
+    ('category', lambda p: p.category.name if p.category else ''),
+    ('supplier', lambda p: p.supplier.name if p.supplier else ''),
+    ('quantity', lambda p: p.quantity),
+    ('reorder_level', lambda p: p.reorder_level),
+    ('cost_price', lambda p: p.cost_price),
+    ('selling_price', lambda p: p.selling_price),
+    ('is_active', lambda p: 'yes' if p.is_active else 'no'),
+    ('created_at', lambda p: _local(p.created_at)),
+    ('updated_at', lambda p: _local(p.updated_at)),
+]
+
+# The import columns come first, so an export can be imported again
+_TRANSACTION_VALUES = {
+    'sku': lambda t: t.product.sku,
+    'transaction_type': lambda t: t.transaction_type,
+    'quantity': lambda t: t.quantity,
+    'reference': lambda t: t.reference,
+    'notes': lambda t: t.notes,
+    'created_at': lambda t: timezone.localtime(t.created_at).isoformat(),
+}
+TRANSACTION_EXPORT_COLUMNS = [(name, _TRANSACTION_VALUES[name]) for name in TRANSACTION_COLUMNS] + [
+    ('product', lambda t: t.product.name),
+    ('unit_cost', lambda t: t.unit_cost),
+    ('unit_price', lambda t: t.unit_price),
+]
+
+
+def product_rows(user):
+    """Header, then one row per product of the user"""
+    yield [name for name, _ in PRODUCT_EXPORT_COLUMNS]
+    products = Product.objects.filter(created_by=user).select_related('category', 'supplier').order_by('pk')
+    for product in products.iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+        yield [value(product) for _, value in PRODUCT_EXPORT_COLUMNS]
+
+
+def transaction_rows(user):
+    """Header, then the user's archived and live transactions, oldest first"""
+    yield [name for name, _ in TRANSACTION_EXPORT_COLUMNS]
+    for model in (TransactionArchive, Transaction):
+        transactions = model.objects.filter(created_by=user).select_related('product').order_by('created_at', 'pk')
+        for transaction in transactions.iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+            yield [value(transaction) for _, value in TRANSACTION_EXPORT_COLUMNS]
+
+
+EXPORTS = {
+    'products': product_rows,
+    'transactions': transaction_rows,
+}
+
+
+class _Echo:
+    """File-like object whose write() just returns the value, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_cell(value):
+    """
+    Text that would be run as a formula is prefixed with ' so it stays
+    text; the importers remove the prefix again.
+    """
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_stream(rows):
+    """Encode rows as CSV text, one line at a time"""
+    writer = csv.writer(_Echo())
+    for row in rows:
+        yield writer.writerow([_csv_cell(value) for value in row])
+
+
+class _ZipBuffer:
+    """Write-only, unseekable sink for zipfile; drained after each write"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+# Characters XML 1.0 does not allow, even escaped
+_INVALID_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+
+def _xlsx_cell(value):
+    # Text is always an inline string cell, never a formula, so a value like
+    # "=HYPERLINK(...)" is shown as typed rather than evaluated
+    if isinstance(value, bool) or value is None:
+        value = '' if value is None else str(value)
+    if isinstance(value, (int, float, Decimal)):
+        return f'<c><v>{value}</v></c>'
+    if isinstance(value, datetime):
+        value = _local(value)
+    text = escape(_INVALID_XML.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def xlsx_stream(rows, sheet_name='Sheet1', rows_per_chunk=500):
+    """Encode rows as a single-sheet XLSX workbook, yielding bytes as it goes"""
+    buffer = _ZipBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as workbook:
+        for name, content in _XLSX_PARTS.items():
+            workbook.writestr(name, content)
+        workbook.writestr('xl/workbook.xml', _WORKBOOK.format(name=escape(sheet_name[:31])))
+        yield buffer.drain()
+
+        with workbook.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            pending = []
+            for row in rows:
+                pending.append('<row>' + ''.join(_xlsx_cell(value) for value in row) + '</row>')
+                if len(pending) >= rows_per_chunk:
+                    sheet.write(''.join(pending).encode())
+                    pending = []
+                    yield buffer.drain()
+            sheet.write(''.join(pending).encode())
+            sheet.write(b'</sheetData></worksheet>')
+        yield buffer.drain()
+    yield buffer.drain()
@@ -0,0 +1,58 @@
+"""
+Model fields.
+
+ResponsiveImageField is an ImageField whose uploads get derivatives
+(inventory.thumbnails) once the saving transaction commits, and whose files
+describe them for templates: thumbnail and preview URLs, and srcset
+sources per modern format.
+"""
+from django.db import models, transaction
+
+from .thumbnails import (
+    RESPONSIVE_FORMATS, derivative_url, responsive_formats, responsive_name, responsive_widths,
+    schedule_derivatives,
+)
+
+
+class ResponsiveImageFieldFile(models.fields.files.ImageFieldFile):
+
+    def save(self, name, content, save=True):
+        super().save(name, content, save)
+        stored_name, storage = self.name, self.storage
+        transaction.on_commit(lambda: schedule_derivatives(stored_name, storage))
+
+    @property
+    def stored_width(self):
+        """Width recorded in the model's width_field, without opening the file"""
+        return getattr(self.instance, self.field.width_field) if self.field.width_field else None
+
+    def derivative_url(self, size):
+        return derivative_url(self, size)
+
+    def srcset(self, image_format):
+        """
+        srcset value for the renditions in `image_format` ('WEBP', 'AVIF'),
+        or '' while they are not generated yet.
+        """
+        widths = responsive_widths(self.stored_width)
+        # The widest rendition is written last
+        if not widths or not self.storage.exists(responsive_name(self.name, widths[-1], image_format)):
+            return ''
+        return ', '.join(
+            f'{self.storage.url(responsive_name(self.name, width, image_format))} {width}w' for width in widths
+        )
+
+    @property
+    def sources(self):
+        """(MIME type, srcset) for each available format, best first, for <picture>"""
+        sources = []
+        for image_format in responsive_formats():
+            srcset = self.srcset(image_format)
+            if srcset:
+                sources.append((RESPONSIVE_FORMATS[image_format][1], srcset))
+        return sources
+
+
+class ResponsiveImageField(models.ImageField):
+    """ImageField with thumbnails and WebP/AVIF srcset renditions"""
+    attr_class = ResponsiveImageFieldFile
@@ -1,7 +1,10 @@
+import uuid
+
 from django import forms
+from django.core.validators import MaxValueValidator
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Layout, Row, Column
-from .models import Product, Category, Supplier, Transaction
+from .models import Product, Category, Supplier, Transaction, MAX_INTEGER
 
 
 class ProductForm(forms.ModelForm):
@@ -91,6 +94,9 @@ class SupplierForm(forms.ModelForm):
 
 
 class TransactionForm(forms.ModelForm):
+    # Generated per rendered form so a double submit is only applied once
+    idempotency_key = forms.CharField(required=False, max_length=255, widget=forms.HiddenInput)
+
     class Meta:
         model = Transaction
         fields = ['product', 'transaction_type', 'quantity', 'reference', 'notes']
@@ -105,6 +111,13 @@ class TransactionForm(forms.ModelForm):
         # Limit product choices to user's products
         if user:
             self.fields['product'].queryset = Product.objects.filter(created_by=user, is_active=True)
+        if not self.is_bound:
+            self.fields['idempotency_key'].initial = uuid.uuid4().hex
+        # The model field only knows the database's limit, which is 64-bit on SQLite
+        quantity = self.fields['quantity']
+        quantity.max_value = MAX_INTEGER
+        quantity.validators.append(MaxValueValidator(MAX_INTEGER))
+        quantity.widget.attrs['max'] = MAX_INTEGER
         
         self.helper = FormHelper()
         self.helper.layout = Layout(
@@ -117,5 +130,92 @@ class TransactionForm(forms.ModelForm):
                 Column('reference', css_class='form-group col-md-6 mb-0'),
             ),
             'notes',
+            'idempotency_key',
+        )
+
+
+
+class MovementForm(forms.Form):
+    """One stock movement in a bulk submission (product given by id)"""
+    product = forms.IntegerField()
+    transaction_type = forms.ChoiceField(choices=Transaction.TRANSACTION_TYPES)
+    quantity = forms.IntegerField(min_value=1, max_value=MAX_INTEGER)
+    reference = forms.CharField(max_length=100, required=False)
+    notes = forms.CharField(required=False)
+
+
+class ProductBulkEditForm(forms.Form):
+    """A price or reorder-level change applied to many products at once"""
+    FIELD_CHOICES = [
+        ('selling_price', 'Selling price'),
+        ('cost_price', 'Cost price'),
+        ('reorder_level', 'Reorder level'),
+    ]
+    CHANGE_CHOICES = [
+        ('percent', 'By percent'),
+        ('amount', 'By amount'),
+    ]
+
+    field = forms.ChoiceField(choices=FIELD_CHOICES)
+    change = forms.ChoiceField(choices=CHANGE_CHOICES)
+    value = forms.DecimalField(
+        max_digits=10, decimal_places=2,
+        help_text="Negative values lower it, e.g. 5 for +5% or -2.50 to take 2.50 off"
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.helper = FormHelper()
+        self.helper.form_tag = False
+        self.helper.layout = Layout(
+            Row(
+                Column('field', css_class='form-group col-md-4 mb-0'),
+                Column('change', css_class='form-group col-md-4 mb-0'),
+                Column('value', css_class='form-group col-md-4 mb-0'),
+            ),
         )
 
+    def clean(self):
+        cleaned_data = super().clean()
+        change, value = cleaned_data.get('change'), cleaned_data.get('value')
+        if value is None:
+            return cleaned_data
+        if change == 'percent' and value < -100:
+            self.add_error('value', 'A price or level cannot drop by more than 100%.')
+        if cleaned_data.get('field') == 'reorder_level' and change == 'amount' and value != int(value):
+            self.add_error('value', 'Reorder levels change by whole numbers.')
+        return cleaned_data
+
+
+class ProductImportRowForm(forms.Form):
+    """One product row of a CSV import; category and supplier are given by name"""
+    BOOLEAN_VALUES = {'yes': True, 'true': True, '1': True, 'no': False, 'false': False, '0': False}
+
+    sku = forms.CharField(max_length=50)
+    name = forms.CharField(max_length=200)
+    description = forms.CharField(required=False)
+    category = forms.CharField(max_length=100, required=False)
+    supplier = forms.CharField(max_length=200, required=False)
+    quantity = forms.IntegerField(min_value=0, required=False)
+    reorder_level = forms.IntegerField(min_value=0, required=False)
+    cost_price = forms.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    selling_price = forms.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    is_active = forms.CharField(required=False)
+
+    def clean_is_active(self):
+        value = self.cleaned_data['is_active'].strip().lower()
+        if not value:
+            return None
+        if value not in self.BOOLEAN_VALUES:
+            raise forms.ValidationError('Use yes or no.')
+        return self.BOOLEAN_VALUES[value]
+
+
+class CSVImportForm(forms.Form):
+    """Upload of a CSV file to import"""
+    file = forms.FileField(help_text="UTF-8 CSV file with a header row")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.helper = FormHelper()
+        self.helper.form_tag = False
@@ -0,0 +1,60 @@
+"""
+Point-in-time stock queries.
+
+Stock on hand at a past moment starts from the latest StockSnapshot taken
+before it and replays only the movements recorded since, so a query costs
+O(products + recent transactions) rather than O(ledger history).
+"""
+from decimal import Decimal
+
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Product, StockSnapshot, net_stock_changes, day_end
+
+
+def stock_at(user, at):
+    """
+    {product_id: {'quantity', 'unit_cost', 'value'}} for the user's products
+    as they stood at datetime `at`.
+
+    Products without a snapshot before `at` (created after the last period
+    close, or never snapshotted) are worked out backwards from their current
+    stock instead.
+    """
+    products = {
+        product.pk: product
+        for product in Product.objects.filter(created_by=user, created_at__lte=at).only('id', 'quantity', 'cost_price')
+    }
+
+    snapshot_day = StockSnapshot.objects.filter(
+        created_by=user, day__lt=timezone.localdate(at)
+    ).aggregate(day=Max('day'))['day']
+    snapshots = {}
+    if snapshot_day is not None:
+        snapshots = {
+            snapshot.product_id: snapshot
+            for snapshot in StockSnapshot.objects.filter(created_by=user, day=snapshot_day)
+        }
+        forward = net_stock_changes(user, created_at__gte=day_end(snapshot_day), created_at__lt=at)
+
+    missing = [pk for pk in products if pk not in snapshots]
+    if missing:
+        backward = net_stock_changes(user, created_at__gte=at, product_id__in=missing)
+
+    stock = {}
+    for pk, product in products.items():
+        if pk in snapshots:
+            quantity = snapshots[pk].quantity + forward.get(pk, 0)
+            unit_cost = snapshots[pk].unit_cost
+        else:
+            quantity = product.quantity - backward.get(pk, 0)
+            unit_cost = product.cost_price
+        quantity = max(quantity, 0)
+        stock[pk] = {'quantity': quantity, 'unit_cost': unit_cost, 'value': quantity * unit_cost}
+    return stock
+
+
+def valuation_at(user, at):
+    """Total inventory value for a user at datetime `at`"""
+    return sum((row['value'] for row in stock_at(user, at).values()), Decimal('0.00'))
@@ -0,0 +1,86 @@
+"""
+Idempotent transaction writes.
+
+Clients send an Idempotency-Key header (or the transaction form's hidden
+idempotency_key field). The first request with a key claims it by inserting
+an IdempotencyKey row in the same database transaction as its stock
+movement; a retry with the same key gets the stored result back and writes
+nothing. Concurrent retries wait on the unique index until the first
+request commits or rolls back. Keys expire after IDEMPOTENCY_KEY_TTL
+seconds; an expired key is claimed afresh and purge_idempotency_keys
+deletes them.
+"""
+import hashlib
+import json
+
+from django.db import IntegrityError, transaction as db_transaction
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyKeyReused(Exception):
+    """The key was already used for a request with a different payload"""
+
+
+def get_key(request, form_value=None):
+    """The request's idempotency key, or None if it did not send one"""
+    key = (request.headers.get(HEADER) or form_value or '').strip()
+    return key[:MAX_KEY_LENGTH] or None
+
+
+def fingerprint(payload):
+    """Stable hash of a JSON-serializable request payload"""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def replay(user, key, payload):
+    """
+    The stored result of an earlier request with this key, or None.
+
+    Lets a retry be answered before its payload is validated again (the
+    data it refers to may have changed since). Raises IdempotencyKeyReused
+    if the key was used with a different payload.
+    """
+    if not key:
+        return None
+    record = IdempotencyKey.objects.filter(
+        created_by=user, key=key, expires_at__gt=timezone.now(), result__isnull=False,
+    ).first()
+    if record is None:
+        return None
+    if record.request_hash != fingerprint(payload):
+        raise IdempotencyKeyReused(key)
+    return record.result
+
+
+def run_once(user, key, payload, action):
+    """
+    Run action() at most once per (user, key).
+
+    action must return a JSON-serializable result. Returns (result, replayed);
+    replayed is True when the result comes from an earlier request. Raises
+    IdempotencyKeyReused if the key was used with a different payload.
+    Without a key the action simply runs.
+    """
+    if not key:
+        return action(), False
+
+    request_hash = fingerprint(payload)
+    with db_transaction.atomic():
+        IdempotencyKey.objects.filter(created_by=user, key=key, expires_at__lte=timezone.now()).delete()
+        try:
+            with db_transaction.atomic():
+                record = IdempotencyKey.objects.create(created_by=user, key=key, request_hash=request_hash)
+        except IntegrityError:
+            record = IdempotencyKey.objects.get(created_by=user, key=key)
+            if record.request_hash != request_hash:
+                raise IdempotencyKeyReused(key)
+            return record.result, True
+
+        record.result = action()
+        record.save(update_fields=['result'])
+        return record.result, False
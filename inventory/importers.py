@@ -0,0 +1,368 @@
+"""
+Streaming CSV imports.
+
+Files are read row by row and written in fixed-size chunks, each committed
+in its own database transaction, so memory use depends on the chunk size
+and not on the size of the file.
+"""
+import csv
+import time
+from collections import Counter, defaultdict
+
+from django.db import connection, transaction as db_transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.core.exceptions import ValidationError
+
+from .forms import MovementForm, ProductImportRowForm
+from .ledger import post_transactions
+from .models import Product, Transaction, Category, Supplier, UserInventoryStats
+from .signals import mark_user_data_changed
+from .similarity import index_products
+
+# Only the first errors are kept in full; the rest are just counted
+MAX_REPORTED_ERRORS = 100
+
+TRANSACTION_COLUMNS = ['sku', 'transaction_type', 'quantity', 'reference', 'notes', 'created_at']
+
+PRODUCT_COLUMNS = [
+    'sku', 'name', 'description', 'category', 'supplier',
+    'quantity', 'reorder_level', 'cost_price', 'selling_price', 'is_active',
+]
+
+# Leading characters that make spreadsheet applications read a cell as a
+# formula. Exports prefix such cells with ' and imports remove it again.
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def unescape_formula(value):
+    """`value` without the ' an export put in front of formula-like text"""
+    if isinstance(value, str) and value.startswith("'") and value[1:].startswith(FORMULA_PREFIXES):
+        return value[1:]
+    return value
+
+
+class _DictReader(csv.DictReader):
+    """DictReader whose rows have export escaping undone, so exports import again"""
+
+    def __next__(self):
+        return {key: unescape_formula(value) for key, value in super().__next__().items()}
+
+
+class ImportResult:
+    """Counters and errors collected while importing a file"""
+
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.error_count = 0
+        self.errors = []
+        self.elapsed = 0.0
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+class ProductImportResult(ImportResult):
+    """ImportResult that also tells created and updated products apart"""
+
+    def __init__(self):
+        super().__init__()
+        self.created = 0
+        self.updated = 0
+
+
+def _sku_map(user):
+    """
+    SKU -> product for the user's active products. SKUs are not unique, so
+    ambiguous SKUs map to None and their rows are reported as errors.
+    """
+    products = {}
+    for product in Product.objects.filter(created_by=user, is_active=True).only(
+        'id', 'sku', 'cost_price', 'selling_price'
+    ).iterator():
+        products[product.sku] = None if product.sku in products else product
+    return products
+
+
+def _parse_created_at(value):
+    if not value:
+        return timezone.now()
+    created_at = parse_datetime(value)
+    if created_at is None:
+        raise ValidationError(f'Invalid created_at "{value}", expected ISO 8601.')
+    if timezone.is_naive(created_at):
+        created_at = timezone.make_aware(created_at)
+    return created_at
+
+
+def import_transactions_csv(user, stream, chunk_size=1000, progress=None):
+    """
+    Import stock movements for a user from a CSV text stream.
+
+    The header must contain sku, transaction_type and quantity; reference,
+    notes and created_at (ISO 8601, defaults to now) are optional. Invalid
+    rows are skipped and reported. progress(result) is called after each
+    committed chunk.
+    """
+    result = ImportResult()
+    started = time.monotonic()
+    reader = _DictReader(stream)
+    missing = {'sku', 'transaction_type', 'quantity'} - set(reader.fieldnames or [])
+    if missing:
+        result.add_error(1, f'Missing column(s): {", ".join(sorted(missing))}')
+        return result
+
+    products = _sku_map(user)
+    chunk = []
+
+    def commit():
+        post_transactions(chunk, use_copy=True)
+        result.imported += len(chunk)
+        chunk.clear()
+        result.elapsed = time.monotonic() - started
+        if progress:
+            progress(result)
+
+    for row in reader:
+        result.rows += 1
+        line = reader.line_num
+        sku = (row.get('sku') or '').strip()
+        product = products.get(sku)
+        if product is None:
+            result.add_error(line, f'SKU "{sku}" is ambiguous.' if sku in products else f'Unknown SKU "{sku}".')
+            continue
+
+        form = MovementForm({
+            'product': product.pk,
+            'transaction_type': (row.get('transaction_type') or '').strip().upper(),
+            'quantity': row.get('quantity'),
+            'reference': row.get('reference') or '',
+            'notes': row.get('notes') or '',
+        })
+        if not form.is_valid():
+            result.add_error(line, '; '.join(
+                f'{name}: {" ".join(messages)}' for name, messages in form.errors.items()
+            ))
+            continue
+        try:
+            created_at = _parse_created_at((row.get('created_at') or '').strip())
+        except ValidationError as e:
+            result.add_error(line, e.messages[0])
+            continue
+
+        data = form.cleaned_data
+        chunk.append(Transaction(
+            product=product,
+            transaction_type=data['transaction_type'],
+            quantity=data['quantity'],
+            reference=data['reference'],
+            notes=data['notes'],
+            created_by=user,
+            created_at=created_at,
+        ))
+        if len(chunk) >= chunk_size:
+            commit()
+
+    if chunk:
+        commit()
+    result.elapsed = time.monotonic() - started
+    return result
+
+
+def _resolve_names(model, user, names, known):
+    """
+    Add the ids of the user's Category/Supplier rows called `names` to
+    `known` (name -> id), creating the missing ones with one INSERT.
+    Returns the number of rows created.
+    """
+    missing = [model(name=name, created_by=user) for name in sorted(set(names) - set(known))]
+    if not missing:
+        return 0
+    features = connection.features
+    if features.supports_update_conflicts_with_target and features.can_return_rows_from_bulk_insert:
+        # ON CONFLICT DO UPDATE returns the id of rows a concurrent import
+        # created in the meantime as well as the new ones
+        model.objects.bulk_create(
+            missing, update_conflicts=True, unique_fields=['name', 'created_by'], update_fields=['updated_at']
+        )
+        known.update((obj.name, obj.pk) for obj in missing)
+    else:
+        model.objects.bulk_create(missing, ignore_conflicts=True)
+        known.update(model.objects.filter(
+            created_by=user, name__in=[obj.name for obj in missing]
+        ).values_list('name', 'id'))
+    # Rows a concurrent import created first are counted too; rebuild_user_stats corrects that
+    return len(missing)
+
+
+def import_products_csv(user, stream, chunk_size=1000, progress=None):
+    """
+    Create or update a user's products from a CSV text stream, matched by SKU.
+
+    The header must contain sku and name; the other PRODUCT_COLUMNS are
+    optional. Only the columns present are written to existing products, and
+    empty numeric cells leave the current value alone. Categories and
+    suppliers are given by name and created when missing. Invalid rows, and
+    SKUs shared by several existing products, are skipped and reported.
+    New stock levels of existing products are posted to the ledger as
+    movements (IN, or ADJUST for decreases) by the difference to the
+    current level. Each chunk is written in one database transaction with
+    a fixed number of queries; progress(result) is called after each one.
+    """
+    result = ProductImportResult()
+    started = time.monotonic()
+    reader = _DictReader(stream)
+    columns = set(reader.fieldnames or [])
+    missing = {'sku', 'name'} - columns
+    if missing:
+        result.add_error(1, f'Missing column(s): {", ".join(sorted(missing))}')
+        return result
+    value_columns = [
+        column for column in PRODUCT_COLUMNS if column in columns and column not in ('category', 'supplier')
+    ]
+    name_columns = [column for column in ('category', 'supplier') if column in columns]
+
+    products = {}
+    for product in Product.objects.filter(created_by=user).order_by().iterator():
+        products[product.sku] = None if product.sku in products else product
+    categories = dict(Category.objects.filter(created_by=user).order_by().values_list('name', 'id'))
+    suppliers = dict(Supplier.objects.filter(created_by=user).order_by().values_list('name', 'id'))
+
+    new_products = []
+    changed = {}  # pk -> (product, names of changed fields)
+    quantities = {}  # pk -> (product, stock level from the file)
+    assignments = []  # (product, {'category': name, 'supplier': name})
+
+    def commit():
+        with db_transaction.atomic():
+            stats = Counter()
+            for column, model, known, counter in (
+                ('category', Category, categories, 'categories_count'),
+                ('supplier', Supplier, suppliers, 'suppliers_count'),
+            ):
+                stats[counter] += _resolve_names(
+                    model, user, [names[column] for _, names in assignments if names.get(column)], known
+                )
+            for product, names in assignments:
+                for column, known in (('category', categories), ('supplier', suppliers)):
+                    if column not in names:
+                        continue
+                    value = known[names[column]] if names[column] else None
+                    if product.pk and getattr(product, f'{column}_id') != value:
+                        changed.setdefault(product.pk, (product, set()))[1].add(column)
+                    setattr(product, f'{column}_id', value)
+
+            # Lock the chunk's existing products and read them as they are now,
+            # not as they were when the import started
+            pks = set(changed) | set(quantities)
+            current = {product.pk: product for product in Product.objects.select_for_update().filter(
+                pk__in=pks
+            ).order_by('pk').only('created_by', 'quantity', 'reorder_level', 'cost_price', 'is_active')} if pks else {}
+
+            Product.objects.bulk_create(new_products)
+            # One UPDATE per distinct set of changed columns, usually just one
+            now = timezone.now()
+            updates = defaultdict(list)
+            for pk, (product, fields) in changed.items():
+                if pk not in current:
+                    continue  # Deleted meanwhile
+                product.updated_at = now
+                product.quantity = current[pk].quantity
+                updates[tuple(sorted(fields | {'updated_at'}))].append(product)
+                stats.update(UserInventoryStats.product_totals(product))
+                stats.subtract(UserInventoryStats.product_totals(current[pk]))
+            for fields, group in updates.items():
+                Product.objects.bulk_update(group, fields)
+
+            for product in new_products:
+                stats.update(UserInventoryStats.product_totals(product))
+            UserInventoryStats.apply({user.pk: stats})
+
+            # Stock levels of existing products move through the ledger, by the
+            # difference to the current level, like any other stock movement
+            movements = []
+            for pk, (product, quantity) in quantities.items():
+                if pk not in current:
+                    continue
+                difference = quantity - current[pk].quantity
+                product.quantity = quantity
+                if difference:
+                    movements.append(Transaction(
+                        product=product,
+                        transaction_type='IN' if difference > 0 else 'ADJUST',
+                        quantity=abs(difference),
+                        reference='Product import',
+                        notes='Stock level set by a product CSV import',
+                        created_by=user,
+                    ))
+            post_transactions(movements)
+
+            index_products(new_products + [product for product, fields in changed.values() if 'name' in fields])
+            mark_user_data_changed(user.pk)
+
+        new_products.clear()
+        changed.clear()
+        quantities.clear()
+        assignments.clear()
+        result.elapsed = time.monotonic() - started
+        if progress:
+            progress(result)
+
+    pending = 0
+    for row in reader:
+        result.rows += 1
+        line = reader.line_num
+        form = ProductImportRowForm({column: (row.get(column) or '').strip() for column in PRODUCT_COLUMNS})
+        if not form.is_valid():
+            result.add_error(line, '; '.join(
+                f'{name}: {" ".join(messages)}' for name, messages in form.errors.items()
+            ))
+            continue
+        data = form.cleaned_data
+
+        sku = data['sku']
+        product = products.get(sku)
+        if product is None and sku in products:
+            result.add_error(line, f'SKU "{sku}" is used by more than one product.')
+            continue
+        if product is None:
+            product = Product(sku=sku, created_by=user)
+            products[sku] = product
+            new_products.append(product)
+            result.created += 1
+        else:
+            result.updated += 1
+
+        for column in value_columns:
+            value = data[column]
+            if value is None:
+                continue
+            if column == 'quantity' and product.pk:
+                # Compared with the current level when the chunk is written
+                quantities[product.pk] = (product, value)
+                continue
+            if getattr(product, column) == value:
+                continue
+            setattr(product, column, value)
+            if product.pk:
+                changed.setdefault(product.pk, (product, set()))[1].add(column)
+        if name_columns:
+            assignments.append((product, {column: data[column] for column in name_columns}))
+
+        result.imported += 1
+        pending += 1
+        if pending >= chunk_size:
+            commit()
+            pending = 0
+
+    if pending:
+        commit()
+    result.elapsed = time.monotonic() - started
+    return result
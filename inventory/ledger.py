@@ -0,0 +1,161 @@
+"""
+Posting many stock movements at once.
+
+Transaction.save handles one movement per call. The functions here write a
+whole batch with a fixed number of queries: one to check product ownership,
+one bulk INSERT for the ledger rows and one grouped UPDATE for stock levels
+(plus the rollup and per-user stats updates).
+"""
+import csv
+import io
+from collections import defaultdict
+
+from django.db import connection, transaction as db_transaction
+from django.db.models import F, Case, When, Value, IntegerField
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .forms import MovementForm
+from .models import Product, Transaction, DailyProfit, DailyTransactionStats, UserInventoryStats
+from .signals import mark_user_data_changed
+
+# Largest batch accepted by the bulk endpoint
+MAX_BATCH_SIZE = 1000
+
+
+def build_transactions(user, items):
+    """
+    Validate raw movement dicts for a user.
+
+    Returns (transactions, errors). Transactions are unsaved; errors is a
+    list of {'index': n, 'errors': {...}} for items that failed validation.
+    """
+    forms = [MovementForm(item if isinstance(item, dict) else {}) for item in items]
+    valid = [form.is_valid() for form in forms]
+
+    # One query resolves every referenced product the user owns
+    product_ids = {form.cleaned_data['product'] for form, ok in zip(forms, valid) if ok}
+    products = Product.objects.filter(created_by=user, is_active=True).in_bulk(product_ids)
+
+    transactions = []
+    errors = []
+    for index, (form, ok) in enumerate(zip(forms, valid)):
+        if ok and form.cleaned_data['product'] not in products:
+            form.add_error('product', 'Product not found.')
+            ok = False
+        if not ok:
+            errors.append({'index': index, 'errors': form.errors.get_json_data()})
+            continue
+
+        data = form.cleaned_data
+        product = products[data['product']]
+        transactions.append(Transaction(
+            product=product,
+            transaction_type=data['transaction_type'],
+            quantity=data['quantity'],
+            reference=data['reference'],
+            notes=data['notes'],
+            unit_cost=product.cost_price,
+            unit_price=product.selling_price,
+            created_by=user,
+        ))
+    return transactions, errors
+
+
+def post_transactions(transactions, batch_size=None, use_copy=False):
+    """
+    Insert transactions and apply their stock movements in one database
+    transaction.
+
+    Movements are netted per product and applied with a single UPDATE, so
+    the zero floor applies to each product's net change in the batch rather
+    than to every movement in turn. With use_copy on PostgreSQL the rows are
+    loaded with COPY through a staging table instead of INSERT (primary keys
+    are then not set on the objects).
+    """
+    if not transactions:
+        return transactions
+
+    for txn in transactions:
+        if txn.unit_cost is None:
+            txn.unit_cost = txn.product.cost_price
+        if txn.unit_price is None:
+            txn.unit_price = txn.product.selling_price
+
+    net_change = defaultdict(int)
+    counts = defaultdict(lambda: {'transactions_count': 0})
+    for txn in transactions:
+        net_change[txn.product_id] += txn.stock_change
+        counts[txn.created_by_id]['transactions_count'] += 1
+
+    with db_transaction.atomic():
+        if use_copy and connection.vendor == 'postgresql':
+            _copy_insert(transactions)
+        else:
+            Transaction.objects.bulk_create(transactions, batch_size=batch_size)
+        adjust_stock(net_change, counts)
+        DailyProfit.record(transactions)
+        DailyTransactionStats.record(transactions)
+
+    for user_id in {txn.created_by_id for txn in transactions}:
+        mark_user_data_changed(user_id)
+    return transactions
+
+
+def adjust_stock(net_change, changes=None):
+    """
+    Apply {product_id: change} to product quantities in one UPDATE, counting
+    it into UserInventoryStats together with any other `changes`
+    ({user_id: {field: increment}}).
+    """
+    net_change = {pk: change for pk, change in net_change.items() if change}
+    if not net_change:
+        UserInventoryStats.apply(changes or {})
+        return
+    change = Case(
+        *[When(pk=pk, then=Value(amount)) for pk, amount in net_change.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    products = Product.objects.filter(pk__in=net_change)
+    quantity = Greatest(F('quantity') + change, 0)
+    UserInventoryStats.record_update(products, changes, quantity=quantity)
+    products.update(quantity=quantity, updated_at=timezone.now())
+
+
+# Columns written by COPY (everything except the primary key)
+_COPY_FIELDS = [
+    field for field in Transaction._meta.concrete_fields if not field.primary_key
+]
+
+
+def _copy_insert(transactions):
+    """
+    Load transactions with PostgreSQL COPY into a temporary staging table,
+    then move them into the ledger with one INSERT ... SELECT.
+    """
+    table = connection.ops.quote_name(Transaction._meta.db_table)
+    staging = connection.ops.quote_name(f'{Transaction._meta.db_table}_staging')
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in _COPY_FIELDS)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for txn in transactions:
+        values = (field.get_db_prep_save(field.pre_save(txn, True), connection) for field in _COPY_FIELDS)
+        writer.writerow([r'\N' if value is None else value for value in values])
+    buffer.seek(0)
+
+    copy_sql = f"COPY {staging} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+    with connection.cursor() as cursor:
+        # Same column types as the ledger, without its constraints
+        cursor.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS {staging} AS SELECT {columns} FROM {table} WITH NO DATA"
+        )
+        raw_cursor = cursor.cursor
+        if hasattr(raw_cursor, 'copy_expert'):  # psycopg2
+            raw_cursor.copy_expert(copy_sql, buffer)
+        else:  # psycopg 3
+            with raw_cursor.copy(copy_sql) as copy:
+                copy.write(buffer.getvalue())
+        cursor.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging}")
+        cursor.execute(f"TRUNCATE {staging}")
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from inventory.models import Transaction
+from inventory.partitions import add_months, archive_before, month_bound, month_start
+
+
+class Command(BaseCommand):
+    help = 'Move transactions from closed months out of the ledger into the archive table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-months', type=int, default=12,
+                            help='Number of recent months (including the current one) kept in the ledger')
+        parser.add_argument('--ahead', type=int, default=3,
+                            help='Months of future partitions to create on PostgreSQL')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be archived')
+
+    def handle(self, *args, **options):
+        if options['keep_months'] < 1:
+            raise CommandError('--keep-months must be at least 1')
+
+        cutoff = add_months(month_start(timezone.now()), 1 - options['keep_months'])
+        self.stdout.write(f'Archiving transactions before {cutoff:%Y-%m}')
+
+        if options['dry_run']:
+            months = Transaction.objects.filter(created_at__lt=month_bound(cutoff)).annotate(
+                month=TruncMonth('created_at')
+            ).values('month').annotate(count=Count('id')).order_by('month')
+            for row in months:
+                self.stdout.write(f"  {row['month']:%Y-%m}: {row['count']} transactions")
+            return
+
+        archived = archive_before(cutoff, months_ahead=options['ahead'])
+        for month, description in archived:
+            label = f'{month:%Y-%m}' if month else 'default'
+            self.stdout.write(f'  {label}: {description}')
+        self.stdout.write(self.style.SUCCESS(f'Archived {len(archived)} period(s)'))
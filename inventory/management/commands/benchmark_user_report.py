@@ -0,0 +1,103 @@
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q, Sum, Count, F
+
+from inventory.models import Category, Supplier, Product, Transaction
+from inventory.stats import user_report
+
+
+def legacy_user_report(users):
+    """The report as it was: every relation joined at once, then de-duplicated"""
+    return list(users.annotate(
+        products_count=Count('products', distinct=True),
+        active_products_count=Count('products', filter=Q(products__is_active=True), distinct=True),
+        categories_count=Count('categories', distinct=True),
+        suppliers_count=Count('suppliers', distinct=True),
+        transactions_count=Count('transactions', distinct=True),
+        total_inventory_value=Sum(
+            F('products__quantity') * F('products__cost_price'), filter=Q(products__is_active=True)
+        ),
+    ).order_by('-date_joined'))
+
+
+class Command(BaseCommand):
+    help = ('Time the admin user report on synthetic data of growing size. '
+            'Everything is created in a transaction that is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=5, help='Synthetic users (default: 5)')
+        parser.add_argument('--scales', default='1000,2000,4000,8000',
+                            help='Comma-separated products per user to measure at (default: 1000,2000,4000,8000)')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per scale; the fastest is reported')
+        parser.add_argument('--legacy', action='store_true',
+                            help='Also time the old joined query (grows with the product of the relation sizes)')
+
+    def handle(self, *args, **options):
+        try:
+            scales = sorted(int(scale) for scale in options['scales'].split(','))
+        except ValueError:
+            raise CommandError('--scales must be comma-separated numbers')
+        if options['users'] < 1 or options['repeat'] < 1 or not scales or scales[0] < 1:
+            raise CommandError('--users, --repeat and every scale must be at least 1')
+
+        reports = [('report', user_report)]
+        if options['legacy']:
+            reports.append(('legacy', legacy_user_report))
+
+        self.stdout.write(f"{'products/user':>13} {'rows':>9} " + ' '.join(
+            f"{label + ' s':>10} {label + ' us/row':>14}" for label, _ in reports
+        ))
+        with transaction.atomic():
+            prefix = f'benchmark-{uuid.uuid4().hex[:8]}'
+            users = User.objects.bulk_create(
+                User(username=f'{prefix}-{index}') for index in range(options['users'])
+            )
+            queryset = User.objects.filter(username__startswith=prefix)
+            created = 0
+            for scale in scales:
+                self._populate(users, created, scale)
+                created = scale
+                rows = sum(
+                    model.objects.filter(created_by__in=users).count()
+                    for model in (Product, Category, Supplier, Transaction)
+                )
+                timings = []
+                for _, report in reports:
+                    best = min(self._time(report, queryset) for _ in range(options['repeat']))
+                    timings.append(f'{best:>10.4f} {best / rows * 1e6:>14.3f}')
+                self.stdout.write(f'{scale:>13} {rows:>9} ' + ' '.join(timings))
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS(
+            'Linear scaling shows as a flat us/row column; synthetic data rolled back'
+        ))
+
+    def _time(self, report, queryset):
+        start = time.perf_counter()
+        report(queryset)
+        return time.perf_counter() - start
+
+    def _populate(self, users, start, stop):
+        """Grow each user to `stop` products, two transactions per product and a category (supplier) per 20 (40)"""
+        for user in users:
+            Category.objects.bulk_create(
+                Category(name=f'Category {index}', created_by=user) for index in range(start // 20, stop // 20)
+            )
+            Supplier.objects.bulk_create(
+                Supplier(name=f'Supplier {index}', created_by=user) for index in range(start // 40, stop // 40)
+            )
+            products = Product.objects.bulk_create((
+                Product(
+                    name=f'Product {index}', sku=f'SKU{index}', quantity=index % 50, reorder_level=10,
+                    cost_price=index % 100, is_active=index % 10 != 0, created_by=user,
+                )
+                for index in range(start, stop)
+            ), batch_size=500)
+            Transaction.objects.bulk_create((
+                Transaction(product=product, transaction_type=transaction_type, quantity=1, created_by=user)
+                for product in products for transaction_type in ('IN', 'OUT')
+            ), batch_size=500)
@@ -0,0 +1,41 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.exports import EXPORTS, csv_stream, xlsx_stream
+
+
+class Command(BaseCommand):
+    help = "Stream a user's products or transactions to a CSV or XLSX file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS), help='What to export')
+        parser.add_argument('--user', required=True, help='Username whose data is exported')
+        parser.add_argument('--format', choices=['csv', 'xlsx'], default='csv')
+        parser.add_argument('--output', help='File to write (CSV goes to stdout if omitted)')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['user']}' does not exist")
+        if options['format'] == 'xlsx' and not options['output']:
+            raise CommandError('--output is required for XLSX exports')
+
+        rows = EXPORTS[options['kind']](user)
+        if not options['output']:
+            for line in csv_stream(rows):
+                self.stdout.write(line, ending='')
+            return
+
+        try:
+            if options['format'] == 'xlsx':
+                with open(options['output'], 'wb') as output:
+                    for chunk in xlsx_stream(rows, sheet_name=options['kind'].title()):
+                        output.write(chunk)
+            else:
+                with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                    output.writelines(csv_stream(rows))
+        except OSError as e:
+            raise CommandError(f"Could not write {options['output']}: {e}")
+        # Keep stdout clean when it is piped somewhere
+        self.stderr.write(f"Exported {options['kind']} to {options['output']}")
@@ -0,0 +1,66 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from inventory.models import Product, StoredImage
+from inventory.thumbnails import derivative_names
+
+
+class Command(BaseCommand):
+    help = 'Delete stored product images (and their thumbnails) that no product references any more'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age-hours', type=float, default=24,
+            help='Only delete images unreferenced and untouched for this long (default: 24)'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be deleted')
+
+    def handle(self, *args, **options):
+        if options['min_age_hours'] < 0:
+            raise CommandError('--min-age-hours cannot be negative')
+        # The grace period covers uploads whose product is not saved yet:
+        # the file is written first, its reference counted at commit
+        cutoff = timezone.now() - timedelta(hours=options['min_age_hours'])
+        storage = Product._meta.get_field('image').storage
+
+        deleted = freed = 0
+        for stored in list(StoredImage.objects.filter(refcount=0, updated_at__lt=cutoff)):
+            if self._touched_since(storage, stored.name, cutoff):
+                continue
+            names = [name for name in (stored.name, *derivative_names(stored.name)) if storage.exists(name)]
+            size = sum(storage.size(name) for name in names)
+            if options['dry_run']:
+                self.stdout.write(f'Would delete {stored.name}')
+            elif not self._delete(storage, stored, names, cutoff):
+                continue
+            deleted += 1
+            freed += size
+
+        verb = 'Would free' if options['dry_run'] else 'Freed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {freed / 1024:.0f} KiB from {deleted} unreferenced images'
+        ))
+
+    def _touched_since(self, storage, name, cutoff):
+        # Uploaded again recently; its new reference may not be counted yet
+        return storage.exists(name) and storage.get_modified_time(name) >= cutoff
+
+    def _delete(self, storage, stored, names, cutoff):
+        """Delete the row and files of `stored` if it is still unreferenced and untouched"""
+        with transaction.atomic():
+            # Holding the row lock makes StoredImage.acquire wait until the
+            # files are gone, and an upload touches the file before it
+            # acquires, so checking the file again now catches one that
+            # started since the first check
+            locked = StoredImage.objects.select_for_update().filter(
+                pk=stored.pk, refcount=0, updated_at__lt=cutoff
+            ).first()
+            if locked is None or self._touched_since(storage, stored.name, cutoff):
+                return False
+            locked.delete()
+            for name in names:
+                storage.delete(name)
+        return True
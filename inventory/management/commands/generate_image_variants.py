@@ -0,0 +1,63 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image, UnidentifiedImageError
+
+from inventory.models import Product
+from inventory.thumbnails import generate_derivatives
+
+
+def process_image(name, force):
+    """Worker: (name, width, height, derivatives written) or (name, None, None, error)"""
+    storage = Product._meta.get_field('image').storage
+    try:
+        with storage.open(name, 'rb') as file:
+            width, height = Image.open(file).size
+        return name, width, height, len(generate_derivatives(name, storage, force=force))
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as e:
+        return name, None, None, str(e)
+
+
+class Command(BaseCommand):
+    help = 'Generate thumbnails and WebP/AVIF renditions for existing product images, in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Worker processes (default: one per CPU core)'
+        )
+        parser.add_argument('--force', action='store_true', help='Regenerate derivatives that already exist')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+
+        # Products sharing an upload are processed once
+        names = sorted(set(
+            Product.objects.exclude(image='').exclude(image__isnull=True).values_list('image', flat=True)
+        ))
+        self.stdout.write(f'{len(names)} images, {options["workers"]} workers')
+
+        # Workers only touch files; the database is updated here. Spawned
+        # (rather than forked) workers need Django set up first.
+        written = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as pool:
+            results = pool.map(process_image, names, [options['force']] * len(names), chunksize=8)
+            for done, (name, width, height, outcome) in enumerate(results, 1):
+                if width is None:
+                    failed += 1
+                    self.stderr.write(f'{name}: {outcome}')
+                    continue
+                written += outcome
+                # Record the stored size the srcset widths are chosen from
+                Product.objects.filter(image=name).exclude(image_width=width, image_height=height).update(
+                    image_width=width, image_height=height
+                )
+                if done % 100 == 0:
+                    self.stdout.write(f'{done} of {len(names)} images done')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {written} derivatives for {len(names) - failed} images ({failed} failed)'
+        ))
@@ -0,0 +1,55 @@
+import csv
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.importers import import_transactions_csv
+
+
+class Command(BaseCommand):
+    help = 'Stream stock movements from a CSV file into the transaction ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help='CSV with sku, transaction_type, quantity[, reference, notes, created_at]')
+        parser.add_argument('--user', required=True, help='Username that owns the products and transactions')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows committed per database transaction')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['user']}' does not exist")
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        committed = 0
+
+        def progress(result):
+            nonlocal committed
+            committed = result.imported
+            self.stdout.write(
+                f'{result.imported} rows committed, {result.error_count} skipped '
+                f'({result.rows_per_second:.0f} rows/s)'
+            )
+
+        try:
+            with open(options['csv_file'], newline='', encoding='utf-8-sig') as stream:
+                result = import_transactions_csv(user, stream, options['chunk_size'], progress)
+        except OSError as e:
+            raise CommandError(f'Could not read {options["csv_file"]}: {e}')
+        except (UnicodeDecodeError, csv.Error) as e:
+            # Chunks before the unreadable part are already saved
+            problem = 'is not valid UTF-8 text' if isinstance(e, UnicodeDecodeError) else f'is not valid CSV ({e})'
+            raise CommandError(
+                f'{options["csv_file"]} {problem}. {committed} row(s) before that point were imported.'
+            )
+
+        for error in result.errors:
+            self.stderr.write(f"Line {error['line']}: {error['error']}")
+        if result.error_count > len(result.errors):
+            self.stderr.write(f'... and {result.error_count - len(result.errors)} more errors')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result.imported} of {result.rows} rows in {result.elapsed:.1f}s '
+            f'({result.rows_per_second:.0f} rows/s)'
+        ))
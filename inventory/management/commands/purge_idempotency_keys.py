@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from inventory.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Delete idempotency keys past their expiry (IDEMPOTENCY_KEY_TTL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many keys would be deleted')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        if options['dry_run']:
+            count = IdempotencyKey.objects.filter(expires_at__lte=now).count()
+            self.stdout.write(f'Would delete {count} expired idempotency keys')
+            return
+        deleted = IdempotencyKey.purge_expired(now)
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired idempotency keys'))
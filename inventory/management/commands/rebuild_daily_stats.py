@@ -0,0 +1,27 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from inventory.models import DailyProfit, DailyTransactionStats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily transaction and profit rollups from the transaction ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only rebuild rollups for this username')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"User '{options['user']}' does not exist")
+
+        with transaction.atomic():
+            DailyTransactionStats.rebuild(user)
+            DailyProfit.rebuild(user)
+
+        scope = f"user '{user.username}'" if user else 'all users'
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt daily rollups for {scope}'))
@@ -0,0 +1,24 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from inventory.models import UserInventoryStats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-user inventory stats shown in the user report'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only rebuild the stats of this username')
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options['user']:
+            users = users.filter(username=options['user'])
+            if not users.exists():
+                raise CommandError(f"User '{options['user']}' does not exist")
+
+        with transaction.atomic():
+            rebuilt = UserInventoryStats.rebuild(users)
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt inventory stats for {rebuilt} user(s)'))
@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from inventory.models import StockSnapshot
+
+
+class Command(BaseCommand):
+    help = 'Snapshot stock levels and valuation at the close of a day (yesterday by default)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Day to snapshot (YYYY-MM-DD)')
+        parser.add_argument('--user', help='Only snapshot products of this username')
+
+    def handle(self, *args, **options):
+        day = timezone.localdate() - timedelta(days=1)
+        if options['date']:
+            day = parse_date(options['date'])
+            if day is None:
+                raise CommandError(f"Invalid date '{options['date']}', expected YYYY-MM-DD")
+        if day >= timezone.localdate():
+            raise CommandError('Only closed days can be snapshotted')
+
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"User '{options['user']}' does not exist")
+
+        count = StockSnapshot.capture(day, user)
+        self.stdout.write(self.style.SUCCESS(f'Snapshotted {count} product(s) for {day}'))
@@ -27,7 +27,10 @@ def assign_existing_data_to_default_user(apps, schema_editor):
         Product.objects.filter(created_by__isnull=True).update(created_by=default_user)
         Transaction.objects.filter(created_by__isnull=True).update(created_by=default_user)
         print(f"Assigned existing records to user: {default_user.username}")
-    else:
+    elif any(
+        model.objects.filter(created_by__isnull=True).exists()
+        for model in (Category, Supplier, Product, Transaction)
+    ):
         # If no users exist, we can't assign - raise error
         raise ValueError(
             "No users found in database. Please create a user first:\n"
@@ -0,0 +1,71 @@
+# Generated by Django 5.0.14 on 2026-10-18 01:15
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Sum, OuterRef, Subquery, ExpressionWrapper, DecimalField
+from django.db.models.functions import Abs, TruncDate
+
+
+def backfill_prices_and_profit(apps, schema_editor):
+    """
+    Existing transactions never recorded their prices, so use the product's
+    current prices (what the dashboard used so far) and build the rollup.
+    """
+    Product = apps.get_model('inventory', 'Product')
+    Transaction = apps.get_model('inventory', 'Transaction')
+    DailyProfit = apps.get_model('inventory', 'DailyProfit')
+
+    product = Product.objects.filter(pk=OuterRef('product_id'))
+    Transaction.objects.filter(unit_cost__isnull=True).update(
+        unit_cost=Subquery(product.values('cost_price')[:1]),
+        unit_price=Subquery(product.values('selling_price')[:1]),
+    )
+
+    profit = ExpressionWrapper(
+        (F('unit_price') - F('unit_cost')) * Abs(F('quantity')),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+    daily = Transaction.objects.filter(transaction_type='OUT').annotate(
+        day=TruncDate('created_at')
+    ).values('created_by_id', 'day').annotate(total=Sum(profit)).order_by()
+    DailyProfit.objects.bulk_create([
+        DailyProfit(created_by_id=d['created_by_id'], day=d['day'], profit=d['total'] or 0)
+        for d in daily
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_remove_product_sku_unique_constraint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='unit_cost',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='unit_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.CreateModel(
+            name='DailyProfit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('profit', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_profits', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['day'],
+                'unique_together': {('created_by', 'day')},
+            },
+        ),
+        migrations.RunPython(backfill_prices_and_profit, migrations.RunPython.noop),
+    ]
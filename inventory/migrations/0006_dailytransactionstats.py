@@ -0,0 +1,52 @@
+# Generated by Django 5.0.14 on 2026-10-18 01:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Sum, Count
+from django.db.models.functions import Abs, TruncDate
+
+
+def build_daily_transaction_stats(apps, schema_editor):
+    """Build the rollup from the existing transaction ledger"""
+    Transaction = apps.get_model('inventory', 'Transaction')
+    DailyTransactionStats = apps.get_model('inventory', 'DailyTransactionStats')
+
+    daily = Transaction.objects.annotate(day=TruncDate('created_at')).values(
+        'created_by_id', 'day', 'transaction_type'
+    ).annotate(total_count=Count('id'), total_quantity=Sum(Abs(F('quantity')))).order_by()
+    DailyTransactionStats.objects.bulk_create([
+        DailyTransactionStats(
+            created_by_id=d['created_by_id'], day=d['day'], transaction_type=d['transaction_type'],
+            count=d['total_count'], quantity=d['total_quantity'] or 0,
+        )
+        for d in daily
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_transaction_unit_prices_dailyprofit'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyTransactionStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('transaction_type', models.CharField(choices=[('IN', 'Stock In'), ('OUT', 'Stock Out'), ('ADJUST', 'Adjustment'), ('RETURN', 'Return')], max_length=10)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('quantity', models.BigIntegerField(default=0)),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_transaction_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Daily transaction stats',
+                'ordering': ['day', 'transaction_type'],
+                'unique_together': {('created_by', 'day', 'transaction_type')},
+            },
+        ),
+        migrations.RunPython(build_daily_transaction_stats, migrations.RunPython.noop),
+    ]
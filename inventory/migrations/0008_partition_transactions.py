@@ -0,0 +1,63 @@
+# Generated by Django 5.0.14 on 2026-10-18 01:23
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def partition_on_postgresql(apps, schema_editor):
+    """Range partition the ledger and its archive by month (PostgreSQL only)"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    from inventory.partitions import LEDGER_TABLE, ARCHIVE_TABLE, convert_to_partitioned
+
+    with schema_editor.connection.cursor() as cursor:
+        convert_to_partitioned(cursor, LEDGER_TABLE, months_ahead=3)
+        convert_to_partitioned(cursor, ARCHIVE_TABLE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_transaction_created_at_default'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_type', models.CharField(choices=[('IN', 'Stock In'), ('OUT', 'Stock Out'), ('ADJUST', 'Adjustment'), ('RETURN', 'Return')], max_length=10)),
+                ('quantity', models.IntegerField()),
+                ('reference', models.CharField(blank=True, max_length=100)),
+                ('notes', models.TextField(blank=True)),
+                ('unit_cost', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('unit_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['created_by', '-created_at'], name='inventory_t_created_41da4e_idx'),
+        ),
+        migrations.AddField(
+            model_name='transactionarchive',
+            name='created_by',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_transactions', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='transactionarchive',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_transactions', to='inventory.product'),
+        ),
+        migrations.AddIndex(
+            model_name='transactionarchive',
+            index=models.Index(fields=['created_by', '-created_at'], name='inventory_t_created_de188b_idx'),
+        ),
+        migrations.RunPython(partition_on_postgresql, migrations.RunPython.noop),
+    ]
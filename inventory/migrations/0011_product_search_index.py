@@ -0,0 +1,76 @@
+from django.db import migrations
+
+
+POSTGRESQL_FORWARD = [
+    """
+    ALTER TABLE inventory_product ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(sku, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX inventory_product_search_idx ON inventory_product USING GIN (search_vector)",
+]
+
+POSTGRESQL_BACKWARD = [
+    "ALTER TABLE inventory_product DROP COLUMN search_vector",
+]
+
+# External-content FTS5 table: stores only the index, reads rows from
+# inventory_product. The triggers (inventory.search.SQLITE_TRIGGERS) skip
+# updates that leave the text unchanged, such as stock movements.
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE inventory_product_fts USING fts5(
+        name, sku, description, content='inventory_product', content_rowid='id'
+    )
+    """,
+    "INSERT INTO inventory_product_fts(inventory_product_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS inventory_product_fts_insert",
+    "DROP TRIGGER IF EXISTS inventory_product_fts_delete",
+    "DROP TRIGGER IF EXISTS inventory_product_fts_update",
+    "DROP TABLE IF EXISTS inventory_product_fts",
+]
+
+
+def _run(schema_editor, statements):
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _run(schema_editor, POSTGRESQL_FORWARD)
+    elif vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            has_fts5 = cursor.fetchone()[0]
+        # Without FTS5, product search falls back to substring matching
+        if has_fts5:
+            from inventory.search import create_sqlite_triggers
+
+            _run(schema_editor, SQLITE_FORWARD)
+            create_sqlite_triggers(schema_editor)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _run(schema_editor, POSTGRESQL_BACKWARD)
+    elif vendor == 'sqlite':
+        _run(schema_editor, SQLITE_BACKWARD)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
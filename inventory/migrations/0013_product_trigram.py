@@ -0,0 +1,63 @@
+# Generated by Django 5.0.14 on 2026-10-18 01:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def build_trigram_index(apps, schema_editor):
+    """pg_trgm GIN indexes on PostgreSQL, the ProductTrigram table elsewhere"""
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute(
+            "CREATE INDEX inventory_product_sku_trgm ON inventory_product USING GIN (sku gin_trgm_ops)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX inventory_product_name_trgm ON inventory_product USING GIN (name gin_trgm_ops)"
+        )
+        return
+
+    from inventory.similarity import trigrams
+
+    Product = apps.get_model('inventory', 'Product')
+    ProductTrigram = apps.get_model('inventory', 'ProductTrigram')
+    rows = []
+    for product in Product.objects.only('id', 'created_by_id', 'sku', 'name').iterator():
+        rows.extend(
+            ProductTrigram(product_id=product.pk, created_by_id=product.created_by_id, trigram=trigram)
+            for trigram in trigrams(product.sku) | trigrams(product.name)
+        )
+        if len(rows) >= 5000:
+            ProductTrigram.objects.bulk_create(rows)
+            rows = []
+    ProductTrigram.objects.bulk_create(rows)
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS inventory_product_sku_trgm")
+        schema_editor.execute("DROP INDEX IF EXISTS inventory_product_name_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0012_product_sort_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_trigrams', to=settings.AUTH_USER_MODEL)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trigrams', to='inventory.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_by', 'trigram'], name='inventory_p_created_a116d4_idx')],
+            },
+        ),
+        migrations.RunPython(build_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.14 on 2026-10-18 01:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def restore_search_triggers(apps, schema_editor):
+    """Adding the column rebuilds inventory_product on SQLite, dropping its triggers"""
+    if schema_editor.connection.vendor == 'sqlite':
+        from inventory.search import create_sqlite_triggers
+
+        create_sqlite_triggers(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0013_product_trigram'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='needs_reorder',
+            field=models.GeneratedField(db_persist=True, expression=models.ExpressionWrapper(models.Q(('quantity__lte', models.F('reorder_level'))), output_field=models.BooleanField()), output_field=models.BooleanField()),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True), ('needs_reorder', True)), fields=['created_by', 'name', 'id'], name='product_reorder_idx'),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.0.14 on 2026-10-18 01:52
+
+import inventory.fields
+from django.db import migrations, models
+
+
+def restore_search_triggers(apps, schema_editor):
+    """Changing the image field rebuilds inventory_product on SQLite, dropping its triggers"""
+    if schema_editor.connection.vendor == 'sqlite':
+        from inventory.search import create_sqlite_triggers
+
+        create_sqlite_triggers(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0015_product_updated_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='image',
+            field=inventory.fields.ResponsiveImageField(blank=True, height_field='image_height', null=True, upload_to='products/', width_field='image_width'),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.0.14 on 2026-10-18 01:55
+
+import inventory.fields
+import inventory.storage
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def restore_search_triggers(apps, schema_editor):
+    """Changing the image field rebuilds inventory_product on SQLite, dropping its triggers"""
+    if schema_editor.connection.vendor == 'sqlite':
+        from inventory.search import create_sqlite_triggers
+
+        create_sqlite_triggers(schema_editor)
+
+
+def count_image_references(apps, schema_editor):
+    """Reference counts for the images products already use (stored under their upload names)"""
+    Product = apps.get_model('inventory', 'Product')
+    StoredImage = apps.get_model('inventory', 'StoredImage')
+    references = Product.objects.exclude(image='').exclude(image__isnull=True).values('image').annotate(
+        products=Count('id')
+    ).order_by()
+    StoredImage.objects.bulk_create(
+        (StoredImage(name=row['image'], refcount=row['products']) for row in references.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0016_product_image_dimensions'),
+    ]
+
+    operations = [
+        # Restores the triggers after the AlterField when migrating backwards
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AlterField(
+            model_name='product',
+            name='image',
+            field=inventory.fields.ResponsiveImageField(blank=True, height_field='image_height', null=True, storage=inventory.storage.ContentAddressedStorage(), upload_to='products/', width_field='image_width'),
+        ),
+        migrations.CreateModel(
+            name='StoredImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['refcount', 'updated_at'], name='inventory_s_refcoun_5405ef_idx')],
+            },
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+        migrations.RunPython(count_image_references, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.0.14 on 2026-10-18 02:07
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def compute_user_stats(apps, schema_editor):
+    """Stats rows for the existing users, computed like inventory.stats.user_report"""
+    User = apps.get_model('auth', 'User')
+    Product = apps.get_model('inventory', 'Product')
+    Category = apps.get_model('inventory', 'Category')
+    Supplier = apps.get_model('inventory', 'Supplier')
+    Transaction = apps.get_model('inventory', 'Transaction')
+    UserInventoryStats = apps.get_model('inventory', 'UserInventoryStats')
+
+    def per_user(queryset, aggregate, default=0):
+        return Coalesce(Subquery(
+            queryset.filter(created_by=OuterRef('pk')).order_by().values('created_by').annotate(
+                value=aggregate
+            ).values('value')
+        ), default)
+
+    active = Product.objects.filter(is_active=True)
+    users = User.objects.annotate(
+        products_count=per_user(Product.objects.all(), Count('pk')),
+        active_products_count=per_user(active, Count('pk')),
+        low_stock_products_count=per_user(active.filter(needs_reorder=True), Count('pk')),
+        categories_count=per_user(Category.objects.all(), Count('pk')),
+        suppliers_count=per_user(Supplier.objects.all(), Count('pk')),
+        transactions_count=per_user(Transaction.objects.all(), Count('pk')),
+        inventory_value=per_user(active, Sum(F('quantity') * F('cost_price')), Decimal('0.00')),
+    ).order_by()
+    fields = [
+        'products_count', 'active_products_count', 'low_stock_products_count', 'categories_count',
+        'suppliers_count', 'transactions_count', 'inventory_value',
+    ]
+    UserInventoryStats.objects.bulk_create(
+        (UserInventoryStats(user_id=user.pk, **{field: getattr(user, field) for field in fields})
+         for user in users.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('inventory', '0017_stored_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserInventoryStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='inventory_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('products_count', models.IntegerField(default=0)),
+                ('active_products_count', models.IntegerField(default=0)),
+                ('low_stock_products_count', models.IntegerField(default=0)),
+                ('categories_count', models.IntegerField(default=0)),
+                ('suppliers_count', models.IntegerField(default=0)),
+                ('transactions_count', models.BigIntegerField(default=0)),
+                ('inventory_value', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'User inventory stats',
+                'indexes': [models.Index(fields=['products_count', 'user'], name='inventory_u_product_8b3c16_idx'), models.Index(fields=['active_products_count', 'user'], name='inventory_u_active__ee574f_idx'), models.Index(fields=['low_stock_products_count', 'user'], name='inventory_u_low_sto_59828b_idx'), models.Index(fields=['transactions_count', 'user'], name='inventory_u_transac_228cd2_idx'), models.Index(fields=['inventory_value', 'user'], name='inventory_u_invento_83d256_idx')],
+            },
+        ),
+        migrations.RunPython(compute_user_stats, migrations.RunPython.noop),
+    ]
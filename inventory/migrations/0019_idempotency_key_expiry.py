@@ -0,0 +1,19 @@
+# Generated by Django 5.0.14 on 2026-10-18 02:22
+
+import inventory.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0018_user_inventory_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='expires_at',
+            field=models.DateTimeField(db_index=True, default=inventory.models._idempotency_key_expiry),
+        ),
+    ]
@@ -1,8 +1,22 @@
-from django.db import models
+from django.db import connection, models, transaction as db_transaction
+from django.db.models import Q, F, Sum, Count, Case, When, ExpressionWrapper, DecimalField, IntegerField
+from django.db.models.functions import Abs, Greatest, TruncDate
+from django.db.models.lookups import LessThanOrEqual
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
+from django.utils import timezone
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta
 from decimal import Decimal
 
+from .fields import ResponsiveImageField
+from .storage import product_image_storage
+
+# Largest value every supported database can store in an IntegerField or
+# PositiveIntegerField (they are 32-bit on PostgreSQL)
+MAX_INTEGER = 2147483647
+
 
 class Category(models.Model):
     """Product category model"""
@@ -56,8 +70,14 @@ class Product(models.Model):
     cost_price = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
     selling_price = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
     
-    # Product image
-    image = models.ImageField(upload_to='products/', blank=True, null=True)
+    # Product image, stored once per distinct content (inventory.storage), with
+    # thumbnails and WebP/AVIF renditions (inventory.thumbnails)
+    image = ResponsiveImageField(
+        upload_to='products/', storage=product_image_storage, blank=True, null=True,
+        width_field='image_width', height_field='image_height',
+    )
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
     
     # Metadata
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='products')
@@ -65,13 +85,40 @@ class Product(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
 
+    # Low or out of stock. Stored by the database from quantity and
+    # reorder_level, so it stays current after the bulk UPDATEs that move stock
+    needs_reorder = models.GeneratedField(
+        expression=ExpressionWrapper(Q(quantity__lte=F('reorder_level')), output_field=models.BooleanField()),
+        output_field=models.BooleanField(),
+        db_persist=True,
+    )
+
     class Meta:
         ordering = ['name']
         # SKU can be duplicated per user - multiple products can share the same SKU
         indexes = [
             models.Index(fields=['sku']),
             models.Index(fields=['name']),
-            models.Index(fields=['created_by']),
+            # One per product_list sort order (views.PRODUCT_ORDERINGS), over
+            # active products only. Partial rather than leading with is_active:
+            # SQLite can only match a bare "is_active" test to an index predicate
+            models.Index(fields=['created_by', 'name', 'id'], condition=Q(is_active=True),
+                         name='product_active_name_idx'),
+            models.Index(fields=['created_by', 'sku', 'id'], condition=Q(is_active=True),
+                         name='product_active_sku_idx'),
+            models.Index(fields=['created_by', 'quantity', 'id'], condition=Q(is_active=True),
+                         name='product_active_quantity_idx'),
+            models.Index(fields=['created_by', 'selling_price', 'id'], condition=Q(is_active=True),
+                         name='product_active_price_idx'),
+            models.Index(fields=['created_by', 'created_at', 'id'], condition=Q(is_active=True),
+                         name='product_active_created_idx'),
+            # Catalog version for the JSON API's ETag: MAX(updated_at) and COUNT
+            models.Index(fields=['created_by', 'updated_at'], condition=Q(is_active=True),
+                         name='product_active_updated_idx'),
+            # Holds only active products needing reorder, so low stock lists
+            # read just those rows
+            models.Index(fields=['created_by', 'name', 'id'], condition=Q(is_active=True, needs_reorder=True),
+                         name='product_reorder_idx'),
         ]
 
     def __str__(self):
@@ -92,6 +139,16 @@ class Product(models.Model):
         else:
             return "In Stock"
 
+    @property
+    def thumbnail_url(self):
+        """Small square image for lists (the original until it is generated)"""
+        return self.image.derivative_url('thumb') if self.image else ''
+
+    @property
+    def preview_url(self):
+        """Image bounded to 800px for the detail page (the original until it is generated)"""
+        return self.image.derivative_url('preview') if self.image else ''
+
     @property
     def profit_margin(self):
         """Calculate profit margin"""
@@ -114,31 +171,522 @@ class Transaction(models.Model):
     quantity = models.IntegerField(help_text="Enter quantity (always positive). Transaction type determines if stock increases or decreases.")
     reference = models.CharField(max_length=100, blank=True, help_text="Invoice, PO, etc.")
     notes = models.TextField(blank=True)
+    # Prices at the time of the transaction (copied from the product on save)
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='transactions')
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Defaults to now; imports of historical movements set it explicitly
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['product', '-created_at']),
+            models.Index(fields=['created_by', '-created_at']),
         ]
 
     def __str__(self):
         return f"{self.transaction_type} - {self.product.name} - {self.quantity}"
 
-    def save(self, *args, **kwargs):
-        """Update product quantity when transaction is saved"""
-        super().save(*args, **kwargs)
-        
-        # Update product quantity
+    @property
+    def profit(self):
+        """Profit for a sale, using the prices captured when it was made"""
+        if self.transaction_type != 'OUT':
+            return Decimal('0.00')
+        return ((self.unit_price or 0) - (self.unit_cost or 0)) * abs(self.quantity)
+
+    @property
+    def stock_change(self):
+        """Signed change in product quantity caused by this transaction"""
         if self.transaction_type in ['IN', 'RETURN']:
-            self.product.quantity += abs(self.quantity)
-        elif self.transaction_type in ['OUT', 'ADJUST']:
-            self.product.quantity -= abs(self.quantity)
-        
-        # Ensure quantity doesn't go negative
-        if self.product.quantity < 0:
-            self.product.quantity = 0
+            return abs(self.quantity)
+        return -abs(self.quantity)
+
+    def save(self, *args, **kwargs):
+        """Update product quantity when a new transaction is saved"""
+        adding = self._state.adding
+        if self.unit_cost is None:
+            self.unit_cost = self.product.cost_price
+        if self.unit_price is None:
+            self.unit_price = self.product.selling_price
+
+        # The ledger row and the stock movement commit (or fail) together
+        with db_transaction.atomic():
+            super().save(*args, **kwargs)
+            
+            # Only new rows move stock and feed the rollups - edits would double count
+            if adding:
+                # Single UPDATE so concurrent transactions can't lose each other's changes.
+                # Quantity never goes negative.
+                products = Product.objects.filter(pk=self.product_id)
+                quantity = Greatest(F('quantity') + self.stock_change, 0)
+                UserInventoryStats.record_update(
+                    products, changes={self.created_by_id: {'transactions_count': 1}}, quantity=quantity
+                )
+                products.update(quantity=quantity, updated_at=timezone.now())
+                DailyProfit.record([self])
+                DailyTransactionStats.record([self])
         
-        self.product.save()
+        if adding:
+            self.product.refresh_from_db(fields=['quantity', 'updated_at'])
+
+
+
+def _increment_rollup(model, totals):
+    """
+    Add increments to rollup rows, creating missing rows.
+    `totals` maps a key (tuple of field/value pairs) to {field: increment}.
+    """
+    for key, increments in totals.items():
+        row, created = model.objects.get_or_create(**dict(key), defaults=increments)
+        if not created:
+            model.objects.filter(pk=row.pk).update(
+                **{field: F(field) + value for field, value in increments.items()}
+            )
+
+
+class TransactionArchive(models.Model):
+    """
+    Transactions from closed periods, moved out of the ledger by the
+    archive_transactions command so hot queries only scan recent rows.
+
+    Must keep exactly the same columns as Transaction: on PostgreSQL whole
+    monthly partitions are moved between the two tables.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='archived_transactions')
+    transaction_type = models.CharField(max_length=10, choices=Transaction.TRANSACTION_TYPES)
+    quantity = models.IntegerField()
+    reference = models.CharField(max_length=100, blank=True)
+    notes = models.TextField(blank=True)
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_transactions')
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_by', '-created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.transaction_type} - {self.product_id} - {self.quantity} (archived)"
+
+
+def _ledger_sources(user=None):
+    """The live ledger and its archive, optionally limited to one user"""
+    sources = [Transaction.objects.all(), TransactionArchive.objects.all()]
+    if user is not None:
+        sources = [source.filter(created_by=user) for source in sources]
+    return sources
+
+
+def net_stock_changes(user=None, **filters):
+    """{product_id: net quantity change} over the ledger and its archive"""
+    change = Case(
+        When(transaction_type__in=['IN', 'RETURN'], then=Abs(F('quantity'))),
+        default=-Abs(F('quantity')),
+        output_field=IntegerField(),
+    )
+    totals = defaultdict(int)
+    for source in _ledger_sources(user):
+        rows = source.filter(**filters).values('product_id').annotate(change=Sum(change)).order_by()
+        for row in rows:
+            totals[row['product_id']] += row['change'] or 0
+    return totals
+
+
+def day_end(day):
+    """Aware datetime at which a local calendar day closes"""
+    return timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+
+
+class DailyProfit(models.Model):
+    """Per-user, per-day profit from sales, maintained by Transaction.save"""
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_profits')
+    day = models.DateField()
+    profit = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+
+    class Meta:
+        ordering = ['day']
+        unique_together = [['created_by', 'day']]
+
+    def __str__(self):
+        return f"{self.created_by} - {self.day} - {self.profit}"
+
+    @classmethod
+    def record(cls, transactions):
+        """Add the profit of new sales to their day's row"""
+        totals = defaultdict(Decimal)
+        for transaction in transactions:
+            if transaction.transaction_type == 'OUT':
+                key = (transaction.created_by_id, timezone.localdate(transaction.created_at))
+                totals[key] += transaction.profit
+
+        _increment_rollup(cls, {
+            (('created_by_id', user_id), ('day', day)): {'profit': profit}
+            for (user_id, day), profit in totals.items()
+        })
+
+    @classmethod
+    def rebuild(cls, user=None):
+        """Recompute the rollup from the transaction ledger and its archive"""
+        rows = cls.objects.all()
+        if user is not None:
+            rows = rows.filter(created_by=user)
+
+        profit = ExpressionWrapper(
+            (F('unit_price') - F('unit_cost')) * Abs(F('quantity')),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        )
+        totals = defaultdict(Decimal)
+        for source in _ledger_sources(user):
+            daily = source.filter(transaction_type='OUT').annotate(day=TruncDate('created_at')).values(
+                'created_by_id', 'day'
+            ).annotate(total=Sum(profit)).order_by()
+            for d in daily:
+                totals[d['created_by_id'], d['day']] += d['total'] or 0
+
+        rows.delete()
+        cls.objects.bulk_create([
+            cls(created_by_id=user_id, day=day, profit=profit)
+            for (user_id, day), profit in totals.items()
+        ])
+
+
+class DailyTransactionStats(models.Model):
+    """Per-user, per-day transaction counts by type, maintained by Transaction.save"""
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_transaction_stats')
+    day = models.DateField()
+    transaction_type = models.CharField(max_length=10, choices=Transaction.TRANSACTION_TYPES)
+    count = models.PositiveIntegerField(default=0)
+    quantity = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Daily transaction stats"
+        ordering = ['day', 'transaction_type']
+        unique_together = [['created_by', 'day', 'transaction_type']]
+
+    def __str__(self):
+        return f"{self.created_by} - {self.day} - {self.transaction_type}: {self.count}"
+
+    @classmethod
+    def record(cls, transactions):
+        """Add new transactions to their day's counters"""
+        totals = defaultdict(lambda: {'count': 0, 'quantity': 0})
+        for transaction in transactions:
+            key = (
+                ('created_by_id', transaction.created_by_id),
+                ('day', timezone.localdate(transaction.created_at)),
+                ('transaction_type', transaction.transaction_type),
+            )
+            totals[key]['count'] += 1
+            totals[key]['quantity'] += abs(transaction.quantity)
+        _increment_rollup(cls, totals)
+
+    @classmethod
+    def rebuild(cls, user=None):
+        """Recompute the rollup from the transaction ledger and its archive"""
+        rows = cls.objects.all()
+        if user is not None:
+            rows = rows.filter(created_by=user)
+
+        totals = defaultdict(lambda: {'count': 0, 'quantity': 0})
+        for source in _ledger_sources(user):
+            daily = source.annotate(day=TruncDate('created_at')).values(
+                'created_by_id', 'day', 'transaction_type'
+            ).annotate(total_count=Count('id'), total_quantity=Sum(Abs(F('quantity')))).order_by()
+            for d in daily:
+                key = (d['created_by_id'], d['day'], d['transaction_type'])
+                totals[key]['count'] += d['total_count']
+                totals[key]['quantity'] += d['total_quantity'] or 0
+
+        rows.delete()
+        cls.objects.bulk_create([
+            cls(created_by_id=user_id, day=day, transaction_type=transaction_type, **values)
+            for (user_id, day, transaction_type), values in totals.items()
+        ])
+
+
+class UserInventoryStats(models.Model):
+    """
+    Running inventory totals of one user, read by the superuser report.
+
+    Maintained incrementally: signals count single saves and deletes, and
+    the bulk write paths (ledger, imports, bulk edit, archiving) add their
+    changes explicitly. The rebuild_user_stats command recomputes every row.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='inventory_stats')
+    products_count = models.IntegerField(default=0)
+    active_products_count = models.IntegerField(default=0)
+    # Active products at or below their reorder level
+    low_stock_products_count = models.IntegerField(default=0)
+    categories_count = models.IntegerField(default=0)
+    suppliers_count = models.IntegerField(default=0)
+    # Transactions in the live ledger (archived ones are not counted)
+    transactions_count = models.BigIntegerField(default=0)
+    # Quantity x cost price over active products
+    inventory_value = models.DecimalField(max_digits=16, decimal_places=2, default=Decimal('0.00'))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Sort orders of the report, each with an index (plus pk, the default)
+    ORDERINGS = [
+        'products_count', 'active_products_count', 'low_stock_products_count',
+        'transactions_count', 'inventory_value',
+    ]
+
+    class Meta:
+        verbose_name_plural = "User inventory stats"
+        indexes = [
+            models.Index(fields=['products_count', 'user']),
+            models.Index(fields=['active_products_count', 'user']),
+            models.Index(fields=['low_stock_products_count', 'user']),
+            models.Index(fields=['transactions_count', 'user']),
+            models.Index(fields=['inventory_value', 'user']),
+        ]
+
+    def __str__(self):
+        return f"{self.user} - {self.products_count} products"
+
+    @staticmethod
+    def product_totals(product, sign=1):
+        """What a product adds to its owner's stats (`sign` -1 takes it away)"""
+        active = product.is_active
+        return {
+            'products_count': sign,
+            'active_products_count': sign if active else 0,
+            'low_stock_products_count': sign if active and product.quantity <= product.reorder_level else 0,
+            'inventory_value': sign * product.quantity * Decimal(product.cost_price) if active else 0,
+        }
+
+    @classmethod
+    def apply(cls, changes):
+        """Add {user_id: {field: increment}} to the users' rows with one UPDATE each"""
+        now = timezone.now()
+        for user_id, increments in changes.items():
+            increments = {field: value for field, value in increments.items() if value}
+            if increments:
+                cls.objects.filter(pk=user_id).update(
+                    updated_at=now, **{field: F(field) + value for field, value in increments.items()}
+                )
+
+    @classmethod
+    def record_products(cls, added=(), removed=(), changes=None):
+        """
+        Count `added` products into their owners' stats and take `removed`
+        ones (deleted products, or the previous state of saved ones) out,
+        together with any other `changes` ({user_id: {field: increment}}).
+        """
+        totals = defaultdict(Counter, {user_id: Counter(values) for user_id, values in (changes or {}).items()})
+        for products, sign in ((added, 1), (removed, -1)):
+            for product in products:
+                totals[product.created_by_id].update(cls.product_totals(product, sign))
+        cls.apply(totals)
+
+    @classmethod
+    def record_update(cls, products, changes=None, **values):
+        """
+        Count what products.update(**values) is about to change - values
+        may set quantity, reorder_level and cost_price - together with any
+        other `changes`. Call it right before the update, in the same
+        database transaction; the rows are locked first where the database
+        supports it, so nobody can change them in between.
+        """
+        if not {'quantity', 'reorder_level', 'cost_price'} & set(values):
+            cls.apply(changes or {})
+            return
+        if connection.features.has_select_for_update:
+            list(products.select_for_update().order_by('pk').values_list('pk', flat=True))
+
+        quantity, reorder_level, cost_price = (
+            values.get(field, F(field)) for field in ('quantity', 'reorder_level', 'cost_price')
+        )
+        active = Q(is_active=True)
+        rows = products.order_by().values('created_by_id').annotate(
+            low_before=Count('pk', filter=active & Q(needs_reorder=True)),
+            low_after=Count('pk', filter=active & Q(LessThanOrEqual(quantity, reorder_level))),
+            value_before=Sum(F('quantity') * F('cost_price'), filter=active),
+            value_after=Sum(quantity * cost_price, filter=active),
+        )
+        totals = defaultdict(Counter, {user_id: Counter(values) for user_id, values in (changes or {}).items()})
+        for row in rows:
+            totals[row['created_by_id']].update({
+                'low_stock_products_count': row['low_after'] - row['low_before'],
+                'inventory_value': (row['value_after'] or 0) - (row['value_before'] or 0),
+            })
+        cls.apply(totals)
+
+    @classmethod
+    def rebuild(cls, users=None):
+        """Recompute the rows of `users` (all by default) from their inventory"""
+        from .stats import user_report
+
+        users = User.objects.all() if users is None else users
+        rows = [
+            cls(
+                user=user,
+                products_count=user.products_count,
+                active_products_count=user.active_products_count,
+                low_stock_products_count=user.low_stock_products_count,
+                categories_count=user.categories_count,
+                suppliers_count=user.suppliers_count,
+                transactions_count=user.transactions_count,
+                inventory_value=user.total_inventory_value or 0,
+            )
+            for user in user_report(users)
+        ]
+        cls.objects.filter(user__in=users).delete()
+        cls.objects.bulk_create(rows)
+        return len(rows)
+
+
+class StockSnapshot(models.Model):
+    """
+    On-hand quantity and valuation of a product at the close of a day.
+
+    Written by the snapshot_stock command at period close; point-in-time
+    queries in inventory.history start from the nearest snapshot instead of
+    replaying the whole ledger.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='snapshots')
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stock_snapshots')
+    day = models.DateField()
+    quantity = models.PositiveIntegerField()
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2)
+    value = models.DecimalField(max_digits=14, decimal_places=2)
+
+    class Meta:
+        ordering = ['-day']
+        unique_together = [['product', 'day']]
+        indexes = [
+            models.Index(fields=['created_by', 'day']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} - {self.day}: {self.quantity}"
+
+    @classmethod
+    def capture(cls, day, user=None):
+        """
+        Snapshot every product that existed at the close of `day`.
+
+        The quantity is the current stock minus the movements recorded since
+        the day closed, so a late run still snapshots the right day. Products
+        are valued at their current cost price. Re-running for the same day
+        overwrites its snapshots.
+        """
+        closed_at = day_end(day)
+        products = Product.objects.filter(created_at__lt=closed_at)
+        if user is not None:
+            products = products.filter(created_by=user)
+        changes = net_stock_changes(user, created_at__gte=closed_at)
+
+        snapshots = []
+        for product in products.only('id', 'created_by_id', 'quantity', 'cost_price').iterator():
+            quantity = max(product.quantity - changes.get(product.pk, 0), 0)
+            snapshots.append(cls(
+                product_id=product.pk,
+                created_by_id=product.created_by_id,
+                day=day,
+                quantity=quantity,
+                unit_cost=product.cost_price,
+                value=quantity * product.cost_price,
+            ))
+        cls.objects.bulk_create(
+            snapshots,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['product', 'day'],
+            update_fields=['quantity', 'unit_cost', 'value'],
+        )
+        return len(snapshots)
+
+
+def _idempotency_key_expiry():
+    return timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+
+
+class IdempotencyKey(models.Model):
+    """
+    A client-supplied key for a transaction write, stored with the result
+    of the first request so retries get the same answer without moving
+    stock again. Keys are honoured until expires_at (IDEMPOTENCY_KEY_TTL)
+    and then purged.
+
+    The result keeps transaction ids in JSON rather than a foreign key: on
+    PostgreSQL the ledger is partitioned and its primary key includes
+    created_at, so it cannot be referenced.
+    """
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    result = models.JSONField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(default=_idempotency_key_expiry, db_index=True)
+
+    class Meta:
+        unique_together = [['created_by', 'key']]  # Keys are unique per user
+
+    def __str__(self):
+        return f"{self.created_by} - {self.key}"
+
+    @classmethod
+    def purge_expired(cls, now=None):
+        """Delete expired keys; returns how many were deleted"""
+        return cls.objects.filter(expires_at__lte=now or timezone.now()).delete()[0]
+
+
+class ProductTrigram(models.Model):
+    """
+    Trigrams of a product's SKU and name, for fuzzy lookup on databases
+    without pg_trgm. Maintained by inventory.similarity.index_products.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='trigrams')
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='product_trigrams')
+    trigram = models.CharField(max_length=3)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_by', 'trigram']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}: {self.trigram!r}"
+
+
+class StoredImage(models.Model):
+    """
+    How many products reference a file in the content-addressed image
+    storage (inventory.storage). Kept up to date by receivers on Product;
+    files left without references are removed by the gc_images command.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['refcount', 'updated_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount})"
+
+    @classmethod
+    def acquire(cls, name):
+        """Count one more reference to the stored file `name`"""
+        increment = {'refcount': F('refcount') + 1, 'updated_at': timezone.now()}
+        if cls.objects.filter(name=name).update(**increment):
+            return
+        _, created = cls.objects.get_or_create(name=name, defaults={'refcount': 1})
+        if not created:
+            # Created concurrently since the UPDATE
+            cls.objects.filter(name=name).update(**increment)
 
+    @classmethod
+    def release(cls, name):
+        """Count one reference less; the file itself is left to gc_images"""
+        cls.objects.filter(name=name, refcount__gt=0).update(
+            refcount=F('refcount') - 1, updated_at=timezone.now()
+        )
@@ -0,0 +1,137 @@
+"""
+Keyset (cursor) pagination.
+
+Page-number pagination needs a COUNT(*) and an OFFSET that scans every
+skipped row, so deep pages get slower. KeysetPaginator orders by
+(sort column, id) and fetches the rows after (or before) the last row seen,
+which costs the same on every page. Cursors are opaque tokens carrying that
+position. The total is only counted when asked for, and only up to
+COUNT_LIMIT rows.
+"""
+import base64
+import json
+import math
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+# Stop counting after this many rows; templates show "1000+"
+COUNT_LIMIT = 1000
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset by a single non-null sort column plus id.
+
+    ordering is a field or annotation name, optionally prefixed with "-".
+    """
+
+    def __init__(self, queryset, per_page, ordering='pk'):
+        self.per_page = per_page
+        self.descending = ordering.startswith('-')
+        self.field = ordering.lstrip('-')
+        if self.field == 'id':
+            self.field = 'pk'
+        prefix = '-' if self.descending else ''
+        keys = [f'{prefix}pk'] if self.field == 'pk' else [f'{prefix}{self.field}', f'{prefix}pk']
+        self.queryset = queryset.order_by(*keys)
+
+    @cached_property
+    def count(self):
+        """Number of rows, counted up to COUNT_LIMIT + 1"""
+        return self.queryset.order_by()[:COUNT_LIMIT + 1].count()
+
+    @property
+    def count_label(self):
+        """The count for display, e.g. 42 or 1000+"""
+        return f'{COUNT_LIMIT}+' if self.count > COUNT_LIMIT else str(self.count)
+
+    def get_page(self, cursor=None):
+        """The page at `cursor`; a missing or invalid cursor gives the first page"""
+        position = self._decode(cursor)
+        if position is None:
+            rows = list(self.queryset[:self.per_page + 1])
+            return KeysetPage(self, rows[:self.per_page], has_next=len(rows) > self.per_page, has_previous=False)
+
+        backward, value, pk = position
+        queryset = self.queryset.reverse() if backward else self.queryset
+        rows = list(self._after(queryset, value, pk, self.descending != backward)[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backward:
+            rows.reverse()
+            return KeysetPage(self, rows, has_next=True, has_previous=more)
+        return KeysetPage(self, rows, has_next=more, has_previous=True)
+
+    def _after(self, queryset, value, pk, descending):
+        op = 'lt' if descending else 'gt'
+        if self.field == 'pk':
+            return queryset.filter(**{f'pk__{op}': pk})
+        return queryset.filter(
+            Q(**{f'{self.field}__{op}': value}) | Q(**{self.field: value, f'pk__{op}': pk})
+        )
+
+    def cursor_for(self, obj, backward=False):
+        value = None if self.field == 'pk' else getattr(obj, self.field)
+        data = json.dumps(['p' if backward else 'n', value, obj.pk], cls=DjangoJSONEncoder)
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    def _decode(self, cursor):
+        if not cursor:
+            return None
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            direction, value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if self.field != 'pk':
+                try:
+                    value = self.queryset.model._meta.get_field(self.field).to_python(value)
+                except FieldDoesNotExist:
+                    # Annotations (search_rank) are float scores
+                    value = float(value)
+                    if not math.isfinite(value):
+                        return None
+                if value is None:
+                    return None
+            return direction == 'p', value, int(pk)
+        except (ValueError, TypeError, ValidationError):
+            return None
+
+
+class KeysetPage:
+    """One page of a KeysetPaginator, usable like a Django Page in templates"""
+
+    def __init__(self, paginator, object_list, has_next, has_previous):
+        self.paginator = paginator
+        self.object_list = object_list
+        self._has_next = has_next and bool(object_list)
+        self._has_previous = has_previous and bool(object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next:
+            return self.paginator.cursor_for(self.object_list[-1])
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous:
+            return self.paginator.cursor_for(self.object_list[0], backward=True)
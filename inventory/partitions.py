@@ -0,0 +1,270 @@
+"""
+Monthly partitioning of the transaction ledger.
+
+On PostgreSQL inventory_transaction and inventory_transactionarchive are
+range partitioned by created_at, one partition per month plus a default
+partition. Archiving a closed month detaches its partition from the ledger
+and attaches it to the archive, which moves no rows.
+
+Other databases have no declarative partitioning, so archiving copies the
+month's rows to the archive table and deletes them from the ledger.
+"""
+import re
+from datetime import date, datetime, time, timezone as dt_timezone
+
+from django.db import connection, transaction as db_transaction
+from django.utils import timezone
+
+LEDGER_TABLE = 'inventory_transaction'
+ARCHIVE_TABLE = 'inventory_transactionarchive'
+
+_PARTITION_NAME = re.compile(r'_y(\d{4})m(\d{2})$')
+
+
+def add_months(month, count):
+    """First day of the month `count` months after `month`"""
+    years, index = divmod(month.month - 1 + count, 12)
+    return date(month.year + years, index + 1, 1)
+
+
+def month_start(value):
+    if isinstance(value, datetime) and timezone.is_aware(value):
+        value = value.astimezone(dt_timezone.utc)
+    return date(value.year, value.month, 1)
+
+
+def month_bound(month):
+    """Aware datetime for the start of a month (partition boundary)"""
+    return datetime.combine(month, time.min, tzinfo=dt_timezone.utc)
+
+
+def partition_name(table, month):
+    return f'{table}_y{month.year}m{month.month:02d}'
+
+
+def _quote(name):
+    return connection.ops.quote_name(name)
+
+
+def _columns():
+    # Named explicitly: column order differs between the ledger and archive
+    from .models import Transaction
+    return ', '.join(_quote(field.column) for field in Transaction._meta.concrete_fields)
+
+
+def _uncount_archived(**filters):
+    """Take ledger rows about to be archived out of the owners' transaction counts"""
+    from django.db.models import Count
+    from .models import Transaction, UserInventoryStats
+
+    rows = Transaction.objects.filter(**filters).order_by().values('created_by_id').annotate(count=Count('pk'))
+    UserInventoryStats.apply({row['created_by_id']: {'transactions_count': -row['count']} for row in rows})
+
+
+def list_partitions(cursor, table):
+    """{month: partition name} for the monthly partitions of a table"""
+    cursor.execute(
+        """
+        SELECT child.relname FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = %s
+        """,
+        [table],
+    )
+    partitions = {}
+    for (name,) in cursor.fetchall():
+        match = _PARTITION_NAME.search(name)
+        if match:
+            partitions[date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return partitions
+
+
+def _range_sql(month):
+    # Dates are generated here, never user input, so inlining them is safe
+    return f"FROM ('{month_bound(month).isoformat()}') TO ('{month_bound(add_months(month, 1)).isoformat()}')"
+
+
+def create_partition(cursor, table, month):
+    """
+    Create the partition of `table` for `month`. Rows of that month already
+    sitting in the default partition are moved into it.
+    """
+    name = partition_name(table, month)
+    default = _quote(f'{table}_default')
+    start, end = month_bound(month), month_bound(add_months(month, 1))
+    holding = _quote(f'{name}_holding')
+    cursor.execute(
+        f"CREATE TEMP TABLE {holding} ON COMMIT DROP AS "
+        f"SELECT * FROM {default} WHERE created_at >= %s AND created_at < %s",
+        [start, end],
+    )
+    cursor.execute(f"DELETE FROM {default} WHERE created_at >= %s AND created_at < %s", [start, end])
+    cursor.execute(f"CREATE TABLE {_quote(name)} PARTITION OF {_quote(table)} FOR VALUES {_range_sql(month)}")
+    cursor.execute(f"INSERT INTO {_quote(table)} SELECT * FROM {holding}")
+    cursor.execute(f"DROP TABLE {holding}")
+    return name
+
+
+def ensure_partitions(cursor, table, first_month, last_month):
+    """Create any missing monthly partitions between two months (inclusive)"""
+    existing = list_partitions(cursor, table)
+    created = []
+    month = first_month
+    while month <= last_month:
+        if month not in existing:
+            created.append(create_partition(cursor, table, month))
+        month = add_months(month, 1)
+    return created
+
+
+def convert_to_partitioned(cursor, table, months_ahead=None):
+    """
+    Rebuild `table` as a table range partitioned by created_at, keeping its
+    rows, indexes, foreign keys and id sequence. Partitions are created for
+    every month holding rows and, with months_ahead, up to that many months
+    past the current one.
+
+    PostgreSQL requires the primary key of a partitioned table to include
+    the partition key, so it becomes (id, created_at).
+    """
+    quoted = _quote(table)
+    old = _quote(f'{table}_unpartitioned')
+
+    # id is either SERIAL (create_tables_postgresql.sql) - a default using a
+    # sequence owned by the column - or an IDENTITY column (Django)
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+    (sequence,) = cursor.fetchone()
+    cursor.execute(
+        "SELECT attidentity <> '' FROM pg_attribute WHERE attrelid = %s::regclass AND attname = 'id'",
+        [table],
+    )
+    (identity,) = cursor.fetchone()
+    # An identity sequence goes with the old table and is created again
+    reuse_sequence = sequence is not None and not identity
+
+    # Index and constraint definitions are recreated once the old table is gone
+    cursor.execute(
+        "SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname <> %s",
+        [table, f'{table}_pkey'],
+    )
+    index_definitions = [row[0] for row in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype IN ('f', 'c')",
+        [table],
+    )
+    constraints = cursor.fetchall()
+
+    cursor.execute(f"ALTER TABLE {quoted} RENAME TO {old}")
+    cursor.execute(
+        f"CREATE TABLE {quoted} (LIKE {old} INCLUDING DEFAULTS EXCLUDING IDENTITY) "
+        f"PARTITION BY RANGE (created_at)"
+    )
+    # A SERIAL default was copied too; it is set again below, once the
+    # sequence no longer depends on the old table
+    cursor.execute(f"ALTER TABLE {quoted} ALTER COLUMN id DROP DEFAULT")
+    cursor.execute(f"CREATE TABLE {_quote(f'{table}_default')} PARTITION OF {quoted} DEFAULT")
+
+    cursor.execute(f"SELECT MIN(created_at), MAX(created_at), MAX(id) FROM {old}")
+    oldest, newest, max_id = cursor.fetchone()
+    months = [month_start(value) for value in (oldest, newest) if value]
+    if months_ahead is not None:
+        this_month = month_start(timezone.now())
+        months += [this_month, add_months(this_month, months_ahead)]
+    if months:
+        ensure_partitions(cursor, table, min(months), max(months))
+
+    cursor.execute(f"INSERT INTO {quoted} SELECT * FROM {old}")
+    if reuse_sequence:
+        # Keep the SERIAL sequence (and its position) when the old table is dropped
+        cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY NONE")
+    cursor.execute(f"DROP TABLE {old}")
+
+    if reuse_sequence:
+        cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {quoted}.id")
+    else:
+        sequence = _quote(f'{table}_id_seq')
+        cursor.execute(f"CREATE SEQUENCE {sequence} OWNED BY {quoted}.id")
+        cursor.execute("SELECT setval(%s, %s, false)", [sequence, (max_id or 0) + 1])
+    # The name comes from the catalog (already quoted where needed) or _quote
+    cursor.execute(f"ALTER TABLE {quoted} ALTER COLUMN id SET DEFAULT nextval(%s::regclass)", [sequence])
+    cursor.execute(f"ALTER TABLE {quoted} ADD CONSTRAINT {_quote(f'{table}_pkey')} PRIMARY KEY (id, created_at)")
+    for name, definition in constraints:
+        cursor.execute(f"ALTER TABLE {quoted} ADD CONSTRAINT {_quote(name)} {definition}")
+    for definition in index_definitions:
+        cursor.execute(definition)
+
+
+def archive_before(cutoff_month, months_ahead=3):
+    """
+    Move every transaction older than `cutoff_month` to the archive and make
+    sure the ledger has partitions `months_ahead` months into the future.
+    Returns a list of (month, description) for what was archived.
+    """
+    if connection.vendor == 'postgresql':
+        return _archive_partitions(cutoff_month, months_ahead)
+    return _archive_rows(cutoff_month)
+
+
+def _archive_partitions(cutoff_month, months_ahead):
+    archived = []
+    with db_transaction.atomic(), connection.cursor() as cursor:
+        this_month = month_start(timezone.now())
+        ensure_partitions(cursor, LEDGER_TABLE, this_month, add_months(this_month, months_ahead))
+        _uncount_archived(created_at__lt=month_bound(cutoff_month))
+
+        for month, name in sorted(list_partitions(cursor, LEDGER_TABLE).items()):
+            if month >= cutoff_month:
+                continue
+            cursor.execute(f"ALTER TABLE {_quote(LEDGER_TABLE)} DETACH PARTITION {_quote(name)}")
+            # Keep the archive's naming convention for the moved partition
+            archive_name = partition_name(ARCHIVE_TABLE, month)
+            cursor.execute(f"ALTER TABLE {_quote(name)} RENAME TO {_quote(archive_name)}")
+            cursor.execute(
+                f"ALTER TABLE {_quote(ARCHIVE_TABLE)} ATTACH PARTITION {_quote(archive_name)} "
+                f"FOR VALUES {_range_sql(month)}"
+            )
+            archived.append((month, f'partition {name} moved to the archive'))
+
+        # Stray old rows in the default partition are copied row by row
+        columns = _columns()
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {_quote(f'{LEDGER_TABLE}_default')} WHERE created_at < %s RETURNING *) "
+            f"INSERT INTO {_quote(ARCHIVE_TABLE)} ({columns}) SELECT {columns} FROM moved",
+            [month_bound(cutoff_month)],
+        )
+        if cursor.rowcount:
+            archived.append((None, f'{cursor.rowcount} rows moved from the default partition'))
+    return archived
+
+
+def _archive_rows(cutoff_month):
+    from .models import Transaction
+
+    oldest = Transaction.objects.order_by('created_at').values_list('created_at', flat=True).first()
+    if oldest is None:
+        return []
+
+    columns = _columns()
+    archived = []
+    month = month_start(oldest)
+    # One database transaction per month keeps each step small
+    while month < cutoff_month:
+        start = connection.ops.adapt_datetimefield_value(month_bound(month))
+        end = connection.ops.adapt_datetimefield_value(month_bound(add_months(month, 1)))
+        with db_transaction.atomic(), connection.cursor() as cursor:
+            _uncount_archived(created_at__gte=month_bound(month), created_at__lt=month_bound(add_months(month, 1)))
+            cursor.execute(
+                f"INSERT INTO {_quote(ARCHIVE_TABLE)} ({columns}) SELECT {columns} FROM {_quote(LEDGER_TABLE)} "
+                f"WHERE created_at >= %s AND created_at < %s",
+                [start, end],
+            )
+            cursor.execute(
+                f"DELETE FROM {_quote(LEDGER_TABLE)} WHERE created_at >= %s AND created_at < %s",
+                [start, end],
+            )
+            if cursor.rowcount:
+                archived.append((month, f'{cursor.rowcount} rows moved to the archive'))
+        month = add_months(month, 1)
+    return archived
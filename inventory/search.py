@@ -0,0 +1,111 @@
+"""
+Ranked full-text search over products.
+
+PostgreSQL keeps a generated tsvector column (inventory_product.search_vector)
+with a GIN index. SQLite keeps an FTS5 external-content table
+(inventory_product_fts) in sync through triggers. Both are maintained by the
+database on every write, including bulk updates, and are created by
+migration 0011. Other databases, or SQLite builds without FTS5, fall back to
+substring matching.
+
+Every search term is matched as a word prefix, so "wid 10" finds
+"Widget" with SKU "W-100".
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q, Value, FloatField, BooleanField
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'inventory_product_fts'
+
+# Weights for (name, sku, description); SQLite bm25 weights in column order
+SQLITE_WEIGHTS = (10.0, 10.0, 1.0)
+
+_WORD = re.compile(r'\w+')
+
+# Keep inventory_product_fts in sync. Django rebuilds a table on SQLite for
+# many schema changes, which drops its triggers, so migrations that alter
+# Product recreate them with create_sqlite_triggers().
+SQLITE_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON inventory_product BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, sku, description)
+        VALUES (new.id, new.name, new.sku, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON inventory_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, sku, description)
+        VALUES ('delete', old.id, old.name, old.sku, old.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF name, sku, description ON inventory_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, sku, description)
+        VALUES ('delete', old.id, old.name, old.sku, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, name, sku, description)
+        VALUES (new.id, new.name, new.sku, new.description);
+    END
+    """,
+]
+
+_fts_available = None
+
+
+def search_terms(query):
+    """Lower-cased words of a search query, without any query syntax"""
+    return [word.lower() for word in _WORD.findall(query)]
+
+
+def sqlite_fts_available():
+    """Whether the FTS5 table exists (the SQLite build may lack FTS5)"""
+    global _fts_available
+    if _fts_available is None:
+        with connection.cursor() as cursor:
+            _fts_available = FTS_TABLE in connection.introspection.table_names(cursor)
+    return _fts_available
+
+
+def create_sqlite_triggers(schema_editor):
+    """(Re)create the FTS5 sync triggers if the FTS5 table exists"""
+    with schema_editor.connection.cursor() as cursor:
+        if FTS_TABLE not in schema_editor.connection.introspection.table_names(cursor):
+            return
+    for statement in SQLITE_TRIGGERS:
+        schema_editor.execute(statement)
+
+
+def search_products(queryset, query):
+    """
+    Filter a Product queryset to matches for `query`, annotated with
+    search_rank (higher is better).
+    """
+    terms = search_terms(query)
+    if not terms:
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    if connection.vendor == 'postgresql':
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        return queryset.filter(
+            RawSQL("inventory_product.search_vector @@ to_tsquery('simple', %s)", [tsquery], BooleanField())
+        ).annotate(search_rank=RawSQL(
+            "ts_rank(inventory_product.search_vector, to_tsquery('simple', %s))", [tsquery], FloatField()
+        ))
+
+    if connection.vendor == 'sqlite' and sqlite_fts_available():
+        match = ' '.join(f'"{term}"*' for term in terms)
+        weights = ', '.join(str(weight) for weight in SQLITE_WEIGHTS)
+        return queryset.filter(
+            pk__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match])
+        ).annotate(search_rank=RawSQL(
+            # bm25 is lower for better matches, so negate it
+            f"(SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND rowid = inventory_product.id)",
+            [match], FloatField(),
+        ))
+
+    condition = Q()
+    for term in terms:
+        condition &= Q(name__icontains=term) | Q(sku__icontains=term) | Q(description__icontains=term)
+    return queryset.filter(condition).annotate(search_rank=Value(0.0, output_field=FloatField()))
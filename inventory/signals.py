@@ -0,0 +1,154 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, QuerySet
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from .cache import bump_generation
+from .models import Product, Category, Supplier, Transaction, StoredImage, UserInventoryStats
+from .similarity import index_products
+
+
+def mark_user_data_changed(user_id):
+    """
+    Invalidate derived data for a user once the current transaction commits.
+
+    Called for every saved or deleted inventory object, and directly by bulk
+    code paths that write with update()/bulk_create() and send no signals.
+    """
+    transaction.on_commit(lambda: bump_generation(user_id))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Supplier)
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Supplier)
+@receiver(post_delete, sender=Transaction)
+def inventory_changed(sender, instance, **kwargs):
+    """Invalidate the owner's cached dashboard when inventory data changes"""
+    mark_user_data_changed(instance.created_by_id)
+
+
+# Product fields the fuzzy lookup trigrams are built from
+INDEXED_FIELDS = {'sku', 'name'}
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created, update_fields=None, **kwargs):
+    """Keep the fuzzy lookup trigrams in step with the SKU and name"""
+    if update_fields is not None and not INDEXED_FIELDS & set(update_fields):
+        return
+    previous = None if created else getattr(instance, '_previous', None)
+    if previous is None or (previous.sku, previous.name) != (instance.sku, instance.name):
+        index_products([instance])
+
+
+# Product fields UserInventoryStats.product_totals depends on
+STATS_FIELDS = {'quantity', 'reorder_level', 'cost_price', 'is_active'}
+
+
+@receiver(pre_save, sender=Product)
+def product_before_save(sender, instance, update_fields=None, **kwargs):
+    """Remember the stored image, indexed and stats fields of the product before this save"""
+    fields = STATS_FIELDS | INDEXED_FIELDS | {'image'}
+    if instance.pk and (update_fields is None or fields & set(update_fields)):
+        instance._previous = Product.objects.only('created_by', *fields).filter(pk=instance.pk).first()
+
+
+@receiver(post_save, sender=Product)
+def product_image_saved(sender, instance, update_fields=None, **kwargs):
+    """Move stored image reference counts when a product's image changes"""
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    previous = getattr(instance, '_previous', None)
+    previous, current = previous.image.name if previous else '', instance.image.name or ''
+    if previous != current:
+        if current:
+            StoredImage.acquire(current)
+        if previous:
+            StoredImage.release(previous)
+
+
+@receiver(post_save, sender=Product)
+def product_stats_saved(sender, instance, created, update_fields=None, **kwargs):
+    """Count the saved product into its owner's stats, in place of its previous state"""
+    if update_fields is not None and not STATS_FIELDS & set(update_fields):
+        return
+    previous = getattr(instance, '_previous', None)
+    UserInventoryStats.record_products(added=[instance], removed=[previous] if previous and not created else [])
+
+
+def _deleted_with(origin, *models):
+    """Whether a delete started from an instance or queryset of one of `models`"""
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return issubclass(model, models)
+
+
+@receiver(post_delete, sender=Product)
+def product_stats_deleted(sender, instance, origin=None, **kwargs):
+    """Take the deleted product out of its owner's stats"""
+    if not _deleted_with(origin, User):
+        UserInventoryStats.record_products(removed=[instance])
+
+
+# Stats counter of each model counted one row at a time
+STATS_COUNTERS = {Category: 'categories_count', Supplier: 'suppliers_count', Transaction: 'transactions_count'}
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Supplier)
+def stats_object_created(sender, instance, created, **kwargs):
+    """Count new categories and suppliers (Transaction.save counts new transactions)"""
+    if created:
+        UserInventoryStats.apply({instance.created_by_id: {STATS_COUNTERS[sender]: 1}})
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Supplier)
+@receiver(post_delete, sender=Transaction)
+def stats_object_deleted(sender, instance, origin=None, **kwargs):
+    """Take deleted categories, suppliers and transactions out of the counts"""
+    # Deleted along with a product or user: counted in one go by the receivers below
+    if not _deleted_with(origin, Product, User):
+        UserInventoryStats.apply({instance.created_by_id: {STATS_COUNTERS[sender]: -1}})
+
+
+def _transaction_counts(transactions):
+    """{user_id: {'transactions_count': -n}} taking `transactions` out of their owners' counts"""
+    rows = transactions.order_by().values('created_by_id').annotate(count=Count('pk'))
+    return {row['created_by_id']: {'transactions_count': -row['count']} for row in rows}
+
+
+@receiver(pre_delete, sender=Product)
+def product_transactions_deleted(sender, instance, origin=None, **kwargs):
+    """Take the transactions a product delete cascades to out of the counts, one UPDATE per owner"""
+    if not _deleted_with(origin, User):
+        UserInventoryStats.apply(_transaction_counts(instance.transactions.all()))
+
+
+@receiver(pre_delete, sender=User)
+def user_transactions_deleted(sender, instance, **kwargs):
+    """
+    The deleted user's stats row goes with them; only other users'
+    transactions on their products are taken out of the counts.
+    """
+    UserInventoryStats.apply(_transaction_counts(
+        Transaction.objects.filter(product__created_by=instance).exclude(created_by=instance)
+    ))
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, **kwargs):
+    """Every user has a stats row, so the report lists them all"""
+    if created:
+        UserInventoryStats.objects.create(user=instance)
+
+
+@receiver(post_delete, sender=Product)
+def product_image_deleted(sender, instance, **kwargs):
+    """Drop the deleted product's stored image reference"""
+    if instance.image:
+        StoredImage.release(instance.image.name)
@@ -0,0 +1,96 @@
+"""
+Fuzzy product lookup by SKU or name.
+
+Similarity is trigram based, like PostgreSQL's pg_trgm: both strings are
+split into lower-cased words, each padded and cut into three-character
+pieces, and the score is the share of trigrams they have in common. Typos
+such as "WDG-1O0" for "WDG-100" still score well.
+
+PostgreSQL uses pg_trgm with GIN indexes on sku and name (migration 0013).
+Other databases keep the trigrams in ProductTrigram, refreshed when a
+product is saved, and score the best candidates here.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Count, FloatField, BooleanField
+from django.db.models.expressions import RawSQL
+
+from .models import Product, ProductTrigram
+
+# Same as pg_trgm.similarity_threshold's default, used by its % operator
+SIMILARITY_THRESHOLD = 0.3
+
+# Candidates scored in Python per lookup on databases without pg_trgm
+CANDIDATE_LIMIT = 50
+
+_WORD = re.compile(r'[^\W_]+')
+
+
+def trigrams(text):
+    """The set of trigrams pg_trgm would extract from text"""
+    grams = set()
+    for word in _WORD.findall((text or '').lower()):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(a, b):
+    """Share of trigrams two strings have in common, from 0 to 1"""
+    first, second = trigrams(a), trigrams(b)
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def product_score(product, query):
+    return max(similarity(product.sku, query), similarity(product.name, query))
+
+
+def index_products(products):
+    """
+    Rewrite the trigram rows of the given products. A no-op on PostgreSQL,
+    where pg_trgm indexes the columns directly.
+    """
+    if connection.vendor == 'postgresql' or not products:
+        return
+    ProductTrigram.objects.filter(product__in=[product.pk for product in products]).delete()
+    ProductTrigram.objects.bulk_create([
+        ProductTrigram(product_id=product.pk, created_by_id=product.created_by_id, trigram=trigram)
+        for product in products
+        for trigram in trigrams(product.sku) | trigrams(product.name)
+    ], batch_size=1000)
+
+
+def similar_products(user, query, limit=10):
+    """
+    Up to `limit` of the user's active products closest to `query` by SKU
+    or name, best first, each with a `similarity` attribute.
+    """
+    query = (query or '').strip()
+    if not trigrams(query):
+        return []
+
+    products = Product.objects.filter(created_by=user, is_active=True)
+    if connection.vendor == 'postgresql':
+        return list(products.filter(
+            RawSQL("(inventory_product.sku %% %s OR inventory_product.name %% %s)", [query, query], BooleanField())
+        ).annotate(similarity=RawSQL(
+            "GREATEST(similarity(inventory_product.sku, %s), similarity(inventory_product.name, %s))",
+            [query, query], FloatField(),
+        )).order_by('-similarity', 'name')[:limit])
+
+    # Products sharing the most trigrams with the query, then exact scores
+    candidate_ids = ProductTrigram.objects.filter(
+        created_by=user, product__is_active=True, trigram__in=trigrams(query)
+    ).values('product_id').annotate(shared=Count('id')).order_by('-shared').values_list(
+        'product_id', flat=True
+    )[:CANDIDATE_LIMIT]
+    matches = []
+    for product in products.filter(pk__in=list(candidate_ids)):
+        product.similarity = product_score(product, query)
+        if product.similarity >= SIMILARITY_THRESHOLD:
+            matches.append(product)
+    matches.sort(key=lambda product: (-product.similarity, product.name))
+    return matches[:limit]
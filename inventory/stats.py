@@ -0,0 +1,139 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db.models import Q, Sum, Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Product, Category, Supplier, Transaction, DailyProfit, DailyTransactionStats
+
+
+def dashboard_counters(user):
+    """
+    Headline dashboard numbers for a user, computed in a single query.
+
+    Every counter is a filtered aggregate over the user's active products,
+    so the database scans the rows once instead of once per number.
+    """
+    low_stock = Q(needs_reorder=True)
+    totals = Product.objects.filter(is_active=True, created_by=user).aggregate(
+        total_products=Count('id'),
+        low_stock_products=Count('id', filter=low_stock),
+        out_of_stock=Count('id', filter=Q(quantity=0)),
+        in_stock_count=Count('id', filter=~low_stock),
+        total_value=Sum(F('quantity') * F('cost_price')),
+    )
+    totals['total_value'] = totals['total_value'] or 0
+    # Low stock (excluding out of stock) for the stock status chart
+    totals['low_stock_count'] = max(totals['low_stock_products'] - totals['out_of_stock'], 0)
+    return totals
+
+
+def _per_user(queryset, aggregate):
+    """Subquery computing `aggregate` over the outer user's rows of `queryset`"""
+    return Subquery(
+        queryset.filter(created_by=OuterRef('pk')).order_by().values('created_by').annotate(
+            value=aggregate
+        ).values('value')
+    )
+
+
+def user_report(users=None):
+    """
+    Users (all by default), newest first, as a list annotated with their
+    product, category, supplier and transaction statistics.
+
+    Every number is its own subquery over a single relation, answered from
+    its created_by index. Joining all the relations at once instead makes
+    the database walk products x categories x suppliers x transactions rows
+    per user.
+    """
+    users = User.objects.all() if users is None else users
+    active = Product.objects.filter(is_active=True)
+    return list(users.annotate(
+        products_count=Coalesce(_per_user(Product.objects.all(), Count('pk')), 0),
+        active_products_count=Coalesce(_per_user(active, Count('pk')), 0),
+        low_stock_products_count=Coalesce(_per_user(active.filter(needs_reorder=True), Count('pk')), 0),
+        total_inventory_value=_per_user(active, Sum(F('quantity') * F('cost_price'))),
+        categories_count=Coalesce(_per_user(Category.objects.all(), Count('pk')), 0),
+        suppliers_count=Coalesce(_per_user(Supplier.objects.all(), Count('pk')), 0),
+        transactions_count=Coalesce(_per_user(Transaction.objects.all(), Count('pk')), 0),
+    ).order_by('-date_joined'))
+
+
+# Dashboard chart datasets. Each returns a JSON-serializable dict and is
+# served by its own endpoint so the page can paint before they are built.
+
+def category_chart(user):
+    """Number of active products per category"""
+    category_data = Category.objects.filter(created_by=user).annotate(
+        product_count=Count('product', filter=Q(product__is_active=True, product__created_by=user))
+    ).filter(product_count__gt=0).values('name', 'product_count')
+    return {
+        'labels': [cat['name'] for cat in category_data],
+        'counts': [cat['product_count'] for cat in category_data],
+    }
+
+
+def _last_30_days_stats(user):
+    return DailyTransactionStats.objects.filter(
+        created_by=user,
+        day__gte=timezone.localdate() - timedelta(days=30),
+    )
+
+
+def transaction_types_chart(user):
+    """Transaction count per type over the last 30 days"""
+    type_data = _last_30_days_stats(user).values('transaction_type').annotate(
+        count=Sum('count')
+    ).order_by('transaction_type')
+    return {
+        'labels': [t['transaction_type'] for t in type_data],
+        'counts': [t['count'] for t in type_data],
+    }
+
+
+def transaction_trends_chart(user):
+    """Transaction count per day over the last 30 days"""
+    trends = _last_30_days_stats(user).values('day').annotate(
+        count=Sum('count')
+    ).order_by('day')
+    return {
+        'dates': [t['day'].strftime('%m/%d') for t in trends],
+        'counts': [t['count'] for t in trends],
+    }
+
+
+def top_products_chart(user):
+    """The ten active products holding the most inventory value"""
+    top_products = Product.objects.filter(is_active=True, created_by=user).annotate(
+        total_value=F('quantity') * F('cost_price')
+    ).order_by('-total_value')[:10]
+    return {
+        'names': [p.name[:20] + '...' if len(p.name) > 20 else p.name for p in top_products],
+        'values': [float(p.quantity * p.cost_price) for p in top_products],
+    }
+
+
+def profit_chart(user):
+    """Cumulative sales profit by day, from the daily profit rollup"""
+    dates = []
+    values = []
+    cumulative_profit = 0
+    for day, profit in DailyProfit.objects.filter(created_by=user).values_list('day', 'profit'):
+        cumulative_profit += float(profit)
+        dates.append(day.strftime('%m/%d'))
+        values.append(cumulative_profit)
+    return {'dates': dates, 'values': values, 'total': cumulative_profit}
+
+
+DASHBOARD_CHARTS = {
+    'categories': category_chart,
+    'transaction-types': transaction_types_chart,
+    'transaction-trends': transaction_trends_chart,
+    'top-products': top_products_chart,
+    'profit': profit_chart,
+}
+
+# Charts over a window ending today: they change at midnight without any write
+DATE_WINDOWED_CHARTS = {'transaction-types', 'transaction-trends'}
@@ -0,0 +1,66 @@
+"""
+Content-addressed file storage for product images.
+
+Every upload is named after the SHA-256 of its content, e.g.
+products/3f/3f7a...c2.jpg, so identical uploads share one file (and one set
+of thumbnails) however many products use them, and the URL of a file never
+changes its content - it can be cached forever by browsers and CDNs.
+
+Files are shared, so they are never deleted along with a product. Products
+hold references counted in StoredImage, and the gc_images command removes
+files nobody has referenced for a while.
+"""
+import hashlib
+import os
+import posixpath
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+
+
+def file_digest(content):
+    """SHA-256 hex digest of a Django File, read in chunks"""
+    sha256 = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        sha256.update(chunk if isinstance(chunk, bytes) else chunk.encode())
+    content.seek(0)
+    return sha256.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that stores each distinct file once, named by its digest"""
+
+    def get_available_name(self, name, max_length=None):
+        # The name is replaced by the digest in _save; equal names mean
+        # equal content, so there is never a reason to pick another one
+        return name
+
+    def content_name(self, name, digest):
+        """Storage name for content with `digest` uploaded as `name`"""
+        folder = posixpath.dirname(name)
+        extension = posixpath.splitext(name)[1].lower()
+        return posixpath.join(folder, digest[:2], f'{digest}{extension}')
+
+    def _save(self, name, content):
+        name = self.content_name(name, file_digest(content))
+        if self.exists(name):
+            # Already stored. Touch it so gc_images, which only removes
+            # files untouched for its grace period, leaves it alone.
+            os.utime(self.path(name))
+            return name
+        return self.save_as(name, content)
+
+    def save_as(self, name, content):
+        """
+        Store `content` under exactly `name`, replacing any file there - for
+        files derived from stored ones, such as thumbnails.
+        """
+        # Write under a unique name and rename, so readers and concurrent
+        # writers of the same name never see a partial file
+        temporary = super()._save(f'{name}.{uuid.uuid4().hex}.tmp', content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
+
+
+product_image_storage = ContentAddressedStorage()
@@ -0,0 +1,194 @@
+"""
+Derivatives of product images.
+
+Uploads are kept as they are. After a product image is uploaded, Pillow
+generates into a "thumbs" folder next to the original (for example
+products/thumbs/photo.jpg-thumb.jpg for products/photo.jpg):
+
+- fixed sizes: a small square thumbnail (product list) and a bounded
+  preview (product detail), as JPEG;
+- responsive renditions at RESPONSIVE_WIDTHS narrower than the original,
+  as WebP and, where Pillow has it, AVIF, for srcset
+  (products/thumbs/photo.jpg-640w.webp).
+
+Generation runs in a thread pool of THUMBNAIL_WORKERS threads (Pillow
+releases the GIL while decoding and resizing), so uploads return without
+waiting for it. Until a derivative exists the original is served instead.
+"""
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+logger = logging.getLogger(__name__)
+
+# name -> (width, height, crop). Cropped sizes are filled exactly, the
+# others fit inside the box. Twice the CSS size, for high-density screens.
+THUMBNAIL_SIZES = {
+    'thumb': (80, 80, True),
+    'preview': (800, 800, False),
+}
+THUMBNAIL_QUALITY = 85
+
+# Widths of the srcset renditions; only those narrower than the original
+# are generated, so images are never upscaled
+RESPONSIVE_WIDTHS = (160, 320, 640, 1280)
+
+# Pillow format -> (extension, MIME type, save options), best first
+RESPONSIVE_FORMATS = {
+    'AVIF': ('avif', 'image/avif', {'quality': 60, 'speed': 6}),
+    'WEBP': ('webp', 'image/webp', {'quality': 80, 'method': 4}),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def responsive_formats():
+    """The RESPONSIVE_FORMATS this Pillow build can encode"""
+    return [name for name in RESPONSIVE_FORMATS if features.check(name.lower())]
+
+
+def responsive_widths(width):
+    """RESPONSIVE_WIDTHS rendered for an original `width` pixels wide"""
+    return [candidate for candidate in RESPONSIVE_WIDTHS if width and candidate < width]
+
+
+def _thumbs_path(name, suffix):
+    # The original's extension is kept, so photo.png and photo.jpg in one
+    # folder get different derivatives
+    folder, filename = posixpath.split(name)
+    return posixpath.join(folder, 'thumbs', f'{filename}-{suffix}')
+
+
+def derivative_name(name, size):
+    """Storage name of the `size` derivative of the image stored as `name`"""
+    return _thumbs_path(name, f'{size}.jpg')
+
+
+def responsive_name(name, width, image_format):
+    """Storage name of the `width` rendition in `image_format` (e.g. 'WEBP')"""
+    return _thumbs_path(name, f'{width}w.{RESPONSIVE_FORMATS[image_format][0]}')
+
+
+def derivative_names(name):
+    """Every name a derivative of the image stored as `name` can have"""
+    return [derivative_name(name, size) for size in THUMBNAIL_SIZES] + [
+        responsive_name(name, width, image_format)
+        for image_format in RESPONSIVE_FORMATS for width in RESPONSIVE_WIDTHS
+    ]
+
+
+def derivative_url(image, size, storage=None):
+    """URL of a derivative of an image field file, or of the original until it exists"""
+    storage = storage or image.storage
+    name = derivative_name(image.name, size)
+    return storage.url(name) if storage.exists(name) else image.url
+
+
+def _targets(name, width):
+    """(storage name, render options) for every derivative of an image `width` pixels wide"""
+    targets = [
+        (derivative_name(name, size), (box_width, box_height, crop, 'JPEG'))
+        for size, (box_width, box_height, crop) in THUMBNAIL_SIZES.items()
+    ]
+    for image_format in responsive_formats():
+        # Widest last: its presence means the whole set was written
+        targets.extend(
+            (responsive_name(name, target_width, image_format), (target_width, None, False, image_format))
+            for target_width in responsive_widths(width)
+        )
+    return targets
+
+
+def _render(original, width, height, crop, image_format):
+    image = original.copy()
+    if crop:
+        image = ImageOps.fit(image, (width, height), Image.Resampling.LANCZOS)
+    else:
+        image.thumbnail((width, height or image.height), Image.Resampling.LANCZOS)
+
+    output = BytesIO()
+    if image_format == 'JPEG':
+        if image.mode not in ('RGB', 'L'):
+            # JPEG has no alpha channel: flatten transparent images onto white
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.convert('RGBA').getchannel('A'))
+            image = background
+        image.save(output, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True, progressive=True)
+    else:
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+        image.save(output, image_format, **RESPONSIVE_FORMATS[image_format][2])
+    return output.getvalue()
+
+
+def generate_derivatives(name, storage=None, force=False):
+    """
+    Write every derivative of the image stored as `name`. Existing ones are
+    kept unless `force`. Returns the names written.
+    """
+    storage = storage or default_storage
+    with storage.open(name, 'rb') as file:
+        original = Image.open(file)
+        # Widths are chosen from the stored size, as Django records it in
+        # Product.image_width, so srcset and the files always agree
+        targets = [
+            (target, options) for target, options in _targets(name, original.width)
+            if force or not storage.exists(target)
+        ]
+        if not targets:
+            return []
+
+        largest = max(max(options[0], options[1] or 0) for _, options in targets)
+        # Let the JPEG decoder downscale while decoding - much faster for
+        # camera photos, and still at least the largest size needed
+        original.draft('RGB', (largest, largest))
+        original = ImageOps.exif_transpose(original)
+        original.load()
+
+    written = []
+    for target, options in targets:
+        content = ContentFile(_render(original, *options))
+        if hasattr(storage, 'save_as'):
+            # Content-addressed storage (inventory.storage) would rename it
+            written.append(storage.save_as(target, content))
+            continue
+        if storage.exists(target):
+            storage.delete(target)
+        written.append(storage.save(target, content))
+    return written
+
+
+def _generate_safely(name, storage, force):
+    try:
+        return generate_derivatives(name, storage, force)
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+        logger.exception('Could not generate derivatives of %s', name)
+        return []
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS, thread_name_prefix='thumbnails'
+            )
+        return _executor
+
+
+def schedule_derivatives(name, storage=None, force=False):
+    """
+    Generate the derivatives of `name` on the worker pool. Returns a Future,
+    or the written names when THUMBNAIL_WORKERS is 0 and it ran inline.
+    """
+    if not settings.THUMBNAIL_WORKERS:
+        return _generate_safely(name, storage, force)
+    return _get_executor().submit(_generate_safely, name, storage, force)
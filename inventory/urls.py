@@ -10,10 +10,15 @@ urlpatterns = [
     
     # Dashboard
     path('', views.dashboard, name='dashboard'),
+    path('dashboard/charts/<slug:chart>/', views.dashboard_chart, name='dashboard_chart'),
     
     # Products
     path('products/', views.product_list, name='product_list'),
     path('products/add/', views.product_create, name='product_create'),
+    path('products/lookup/', views.product_lookup, name='product_lookup'),
+    path('products/export/', views.product_export, name='product_export'),
+    path('products/import/', views.product_import, name='product_import'),
+    path('products/bulk-edit/', views.product_bulk_edit, name='product_bulk_edit'),
     path('products/<int:pk>/', views.product_detail, name='product_detail'),
     path('products/<int:pk>/edit/', views.product_update, name='product_update'),
     path('products/<int:pk>/delete/', views.product_delete, name='product_delete'),
@@ -28,6 +33,12 @@ urlpatterns = [
     
     # Transactions
     path('transactions/add/', views.transaction_create, name='transaction_create'),
+    path('transactions/bulk/', views.transaction_bulk_create, name='transaction_bulk_create'),
+    path('transactions/import/', views.transaction_import, name='transaction_import'),
+    path('transactions/export/', views.transaction_export, name='transaction_export'),
+    
+    # JSON API
+    path('api/products/', views.product_catalog_api, name='product_catalog_api'),
     
     # Admin User Report (superuser only)
     path('reports/user-report/', views.admin_user_report, name='admin_user_report'),
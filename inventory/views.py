@@ -1,180 +1,128 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.contrib.auth.models import User
-from django.db.models import Q, Sum, Count, F
-from django.core.paginator import Paginator
+from django.db.models import Count, Max, Sum
 from django.utils import timezone
-from django.utils.safestring import mark_safe
-from django.http import JsonResponse
+from django.http import JsonResponse, Http404, HttpResponseBadRequest, StreamingHttpResponse
 from django.db import connection
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_POST
+from django.utils.cache import patch_cache_control
+import csv
+import hashlib
+import io
 import json
 import os
-from datetime import timedelta
-from .models import Product, Category, Supplier, Transaction
-from .forms import ProductForm, CategoryForm, SupplierForm, TransactionForm
+from .models import Product, Category, Supplier, Transaction, UserInventoryStats
+from .forms import ProductForm, ProductBulkEditForm, CategoryForm, SupplierForm, TransactionForm, CSVImportForm
+from .stats import dashboard_counters, DASHBOARD_CHARTS, DATE_WINDOWED_CHARTS
+from .cache import cached_for_user, get_generation
+from .ledger import build_transactions, post_transactions, MAX_BATCH_SIZE
+from .importers import import_transactions_csv, import_products_csv, TRANSACTION_COLUMNS, PRODUCT_COLUMNS
+from .exports import EXPORTS, csv_stream, xlsx_stream
+from .idempotency import get_key, replay, run_once, IdempotencyKeyReused
+from .search import search_products
+from .pagination import KeysetPaginator
+from .similarity import similar_products
+from .bulk_edit import bulk_edit_products
 
 
-@login_required
-def dashboard(request):
-    """Dashboard view with inventory overview - user-specific data"""
-    # Filter all queries by logged-in user
-    user_products = Product.objects.filter(is_active=True, created_by=request.user)
+def _dashboard_context(user):
+    """Build the dashboard template context for a user"""
+    # Filter all queries by the given user
+    user_products = Product.objects.filter(is_active=True, created_by=user)
     
-    total_products = user_products.count()
-    low_stock_products = user_products.filter(quantity__lte=F('reorder_level')).count()
-    out_of_stock = user_products.filter(quantity=0).count()
-    total_value = user_products.aggregate(
-        total=Sum(F('quantity') * F('cost_price'))
-    )['total'] or 0
+    # Headline counters (totals, stock status, value) in one aggregate query
+    counters = dashboard_counters(user)
     
     # Recent transactions - only user's transactions
-    recent_transactions = Transaction.objects.filter(created_by=request.user).select_related('product').order_by('-created_at')[:10]
+    recent_transactions = list(
+        Transaction.objects.filter(created_by=user).select_related('product', 'created_by').order_by('-created_at')[:10]
+    )
     
     # Low stock products - only user's products
-    low_stock_items = user_products.filter(
-        quantity__lte=F('reorder_level')
-    ).order_by('quantity')[:10]
-    
-    # Chart Data: Products by Category - only user's categories
-    category_data = Category.objects.filter(created_by=request.user).annotate(
-        product_count=Count('product', filter=Q(product__is_active=True, product__created_by=request.user))
-    ).filter(product_count__gt=0).values('name', 'product_count')
-    category_labels = [cat['name'] for cat in category_data]
-    category_counts = [cat['product_count'] for cat in category_data]
-    
-    # Chart Data: Stock Status Distribution - only user's products
-    in_stock_count = user_products.filter(quantity__gt=F('reorder_level')).count()
-    low_stock_count = low_stock_products - out_of_stock if low_stock_products > out_of_stock else 0
-    
-    # Chart Data: Transaction Types (last 30 days) - only user's transactions
-    thirty_days_ago = timezone.now() - timedelta(days=30)
-    transaction_type_data = Transaction.objects.filter(
-        created_by=request.user,
-        created_at__gte=thirty_days_ago
-    ).values('transaction_type').annotate(
-        count=Count('id')
-    ).order_by('transaction_type')
-    transaction_labels = [t['transaction_type'] for t in transaction_type_data]
-    transaction_counts = [t['count'] for t in transaction_type_data]
-    
-    # Chart Data: Transaction Trends (last 30 days by date) - only user's transactions
-    from django.db import connection
-    if connection.vendor == 'sqlite':
-        # SQLite specific date extraction
-        transaction_trends = Transaction.objects.filter(
-            created_by=request.user,
-            created_at__gte=thirty_days_ago
-        ).extra(
-            select={'day': "date(created_at, 'localtime')"}
-        ).values('day').annotate(
-            count=Count('id')
-        ).order_by('day')
-    else:
-        # PostgreSQL/MySQL date extraction
-        transaction_trends = Transaction.objects.filter(
-            created_by=request.user,
-            created_at__gte=thirty_days_ago
-        ).extra(
-            select={'day': 'date(created_at)'}
-        ).values('day').annotate(
-            count=Count('id')
-        ).order_by('day')
-    
-    trend_dates = []
-    trend_counts = []
-    for t in transaction_trends:
-        if t['day']:
-            try:
-                if isinstance(t['day'], str):
-                    from datetime import datetime
-                    day_obj = datetime.strptime(t['day'], '%Y-%m-%d').date()
-                else:
-                    day_obj = t['day']
-                trend_dates.append(day_obj.strftime('%m/%d'))
-            except:
-                trend_dates.append(str(t['day'])[:10])
-            trend_counts.append(t['count'])
-    
-    # Chart Data: Top Products by Value - only user's products
-    top_products_by_value = user_products.annotate(
-        total_value=Sum(F('quantity') * F('cost_price'))
-    ).order_by('-total_value')[:10]
-    top_product_names = [p.name[:20] + '...' if len(p.name) > 20 else p.name for p in top_products_by_value]
-    top_product_values = [float(p.quantity * p.cost_price) for p in top_products_by_value]
-    
-    # Chart Data: Profit Over Time (from OUT transactions - sales)
-    # Get all OUT transactions (sales) for the user
-    sales_transactions = Transaction.objects.filter(
-        created_by=request.user,
-        transaction_type='OUT'
-    ).select_related('product').order_by('created_at')
-    
-    # Calculate profit per transaction and group by date
-    profit_by_date = {}
-    cumulative_profit = 0
-    
-    for transaction in sales_transactions:
-        # Calculate profit: (selling_price - cost_price) * quantity
-        profit = float((transaction.product.selling_price - transaction.product.cost_price) * abs(transaction.quantity))
-        cumulative_profit += profit
-        
-        # Extract date
-        date_key = transaction.created_at.date()
-        
-        # Store cumulative profit for each date
-        if date_key not in profit_by_date:
-            profit_by_date[date_key] = 0
-        profit_by_date[date_key] = cumulative_profit
-    
-    # Sort by date and prepare data for chart
-    profit_dates = []
-    profit_values = []
-    for date_key in sorted(profit_by_date.keys()):
-        profit_dates.append(date_key.strftime('%m/%d'))
-        profit_values.append(profit_by_date[date_key])
+    low_stock_items = list(user_products.filter(
+        needs_reorder=True
+    ).order_by('quantity')[:10])
     
+    # Chart datasets are loaded by the page from dashboard_chart
     context = {
-        'total_products': total_products,
-        'low_stock_products': low_stock_products,
-        'out_of_stock': out_of_stock,
-        'total_value': total_value,
+        'total_products': counters['total_products'],
+        'low_stock_products': counters['low_stock_products'],
+        'out_of_stock': counters['out_of_stock'],
+        'total_value': counters['total_value'],
         'recent_transactions': recent_transactions,
         'low_stock_items': low_stock_items,
-        # Chart data (as JSON strings for safe template rendering)
-        'category_labels': mark_safe(json.dumps(category_labels)),
-        'category_counts': mark_safe(json.dumps(category_counts)),
-        'in_stock_count': in_stock_count,
-        'low_stock_count': low_stock_count,
-        'transaction_labels': mark_safe(json.dumps(transaction_labels)),
-        'transaction_counts': mark_safe(json.dumps(transaction_counts)),
-        'trend_dates': mark_safe(json.dumps(trend_dates)),
-        'trend_counts': mark_safe(json.dumps(trend_counts)),
-        'top_product_names': mark_safe(json.dumps(top_product_names)),
-        'top_product_values': mark_safe(json.dumps(top_product_values)),
-        'profit_dates': mark_safe(json.dumps(profit_dates)),
-        'profit_values': mark_safe(json.dumps(profit_values)),
-        'total_profit': cumulative_profit,
+        'in_stock_count': counters['in_stock_count'],
+        'low_stock_count': counters['low_stock_count'],
     }
+    return context
+
+
+@login_required
+def dashboard(request):
+    """Dashboard view with inventory overview - user-specific data"""
+    # Cached per user until the user's inventory data changes
+    context = cached_for_user(request.user.pk, 'dashboard', lambda: _dashboard_context(request.user))
     return render(request, 'inventory/dashboard.html', context)
 
 
+# Browser cache lifetime (seconds) of each dashboard chart endpoint
+DASHBOARD_CHART_MAX_AGE = {
+    'categories': 300,
+    'transaction-types': 120,
+    'transaction-trends': 120,
+    'top-products': 300,
+    'profit': 600,
+}
+
+
+def _dashboard_chart_version(chart):
+    """The chart name, with today's date for charts over the last 30 days"""
+    if chart in DATE_WINDOWED_CHARTS:
+        return f'{chart}-{timezone.localdate():%Y%m%d}'
+    return chart
+
+
+def _dashboard_chart_etag(request, chart):
+    """Charts only change when the user's cache generation (or the day) does"""
+    if chart not in DASHBOARD_CHARTS:
+        return None
+    return f'{_dashboard_chart_version(chart)}-{get_generation(request.user.pk)}'
+
+
 @login_required
-def product_list(request):
-    """List all products with search and filter - user-specific"""
+@condition(etag_func=_dashboard_chart_etag)
+def dashboard_chart(request, chart):
+    """JSON data for one dashboard chart - user-specific"""
+    if chart not in DASHBOARD_CHARTS:
+        raise Http404('Unknown chart')
+    builder = DASHBOARD_CHARTS[chart]
+    data = cached_for_user(request.user.pk, f'chart:{_dashboard_chart_version(chart)}', lambda: builder(request.user))
+    response = JsonResponse(data)
+    patch_cache_control(response, private=True, max_age=DASHBOARD_CHART_MAX_AGE[chart])
+    return response
+
+
+# Sort columns offered by product_list. Each has a matching partial index on
+# Product, (created_by, column, id) WHERE is_active; both directions use it.
+PRODUCT_ORDERINGS = ['name', 'sku', 'quantity', 'selling_price', 'created_at']
+
+
+def _filtered_products(request):
+    """
+    The user's active products matching the product list filters in the
+    query string, with the (search, category, stock) filter values.
+    """
     # Filter products by logged-in user
     products = Product.objects.filter(is_active=True, created_by=request.user).select_related('category', 'supplier')
     
-    # Search functionality
+    # Search functionality - full-text index, best matches first
     search_query = request.GET.get('search', '')
     if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) |
-            Q(sku__icontains=search_query) |
-            Q(description__icontains=search_query)
-        )
+        products = search_products(products, search_query)
     
     # Filter by category - only user's categories
     category_filter = request.GET.get('category', '')
@@ -184,18 +132,33 @@ def product_list(request):
     # Filter by stock status
     stock_filter = request.GET.get('stock', '')
     if stock_filter == 'low':
-        products = products.filter(quantity__lte=F('reorder_level'))
+        products = products.filter(needs_reorder=True)
     elif stock_filter == 'out':
         products = products.filter(quantity=0)
     
-    # Ordering
-    order_by = request.GET.get('order_by', 'name')
-    products = products.order_by(order_by)
+    return products, search_query, category_filter, stock_filter
+
+
+@login_required
+def product_list(request):
+    """List all products with search and filter - user-specific"""
+    products, search_query, category_filter, stock_filter = _filtered_products(request)
+    
+    # Ordering - only indexed sort orders; search results default to relevance
+    order_by = request.GET.get('order_by', '') or ('-search_rank' if search_query else 'name')
+    if order_by.lstrip('-') not in PRODUCT_ORDERINGS and not (search_query and order_by == '-search_rank'):
+        return HttpResponseBadRequest('Unsupported sort order.')
+    
+    # Keyset pagination - every page costs the same, no COUNT(*) unless shown
+    paginator = KeysetPaginator(products, 20, order_by)  # 20 products per page
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
-    # Pagination
-    paginator = Paginator(products, 20)  # 20 products per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Filters carried over by the previous/next and sort links
+    page_query = request.GET.copy()
+    page_query.pop('cursor', None)
+    page_query.pop('page', None)
+    sort_query = page_query.copy()
+    sort_query.pop('order_by', None)
     
     # Only show user's categories
     categories = Category.objects.filter(created_by=request.user)
@@ -208,10 +171,153 @@ def product_list(request):
         'category_filter': category_filter,
         'stock_filter': stock_filter,
         'order_by': order_by,
+        'page_query': page_query.urlencode(),
+        'sort_query': sort_query.urlencode(),
     }
     return render(request, 'inventory/product_list.html', context)
 
 
+@login_required
+def product_bulk_edit(request):
+    """Change prices or reorder levels of all filtered products at once - user-specific"""
+    # Same filters as the product list, carried in the query string
+    products, search_query, category_filter, stock_filter = _filtered_products(request)
+    filter_query = request.GET.copy()
+    for name in ('cursor', 'page', 'order_by'):
+        filter_query.pop(name, None)
+    
+    if request.method == 'POST':
+        form = ProductBulkEditForm(request.POST)
+        if form.is_valid():
+            updated = bulk_edit_products(products, request.user, **form.cleaned_data)
+            field_label = dict(form.FIELD_CHOICES)[form.cleaned_data['field']].lower()
+            messages.success(request, f'Updated the {field_label} of {updated} product(s).')
+            return redirect(f"{reverse('inventory:product_list')}?{filter_query.urlencode()}")
+    else:
+        form = ProductBulkEditForm()
+    
+    category = Category.objects.filter(pk=category_filter, created_by=request.user).first() if category_filter else None
+    return render(request, 'inventory/product_bulk_edit.html', {
+        'form': form,
+        'product_count': products.count(),
+        'search_query': search_query,
+        'category': category,
+        'stock_filter': stock_filter,
+        'filter_query': filter_query.urlencode(),
+    })
+
+
+# Fields the catalog API can return, with the model attribute behind each
+CATALOG_FIELDS = {
+    'id': 'id',
+    'name': 'name',
+    'sku': 'sku',
+    'description': 'description',
+    'category': 'category_id',
+    'supplier': 'supplier_id',
+    'quantity': 'quantity',
+    'reorder_level': 'reorder_level',
+    'needs_reorder': 'needs_reorder',
+    'cost_price': 'cost_price',
+    'selling_price': 'selling_price',
+    'image': 'image',
+    'updated_at': 'updated_at',
+}
+CATALOG_DEFAULT_FIELDS = ['id', 'name', 'sku', 'quantity', 'selling_price', 'updated_at']
+CATALOG_PAGE_SIZE = 100
+CATALOG_MAX_PAGE_SIZE = 500
+
+
+def _catalog_params(request):
+    """(fields, limit) requested from the catalog API; ValueError if invalid"""
+    fields = [name for name in request.GET.get('fields', '').split(',') if name] or CATALOG_DEFAULT_FIELDS
+    unknown = [name for name in fields if name not in CATALOG_FIELDS]
+    if unknown:
+        raise ValueError(f'Unknown field(s): {", ".join(unknown)}')
+    limit = int(request.GET.get('limit', CATALOG_PAGE_SIZE))
+    if not 1 <= limit <= CATALOG_MAX_PAGE_SIZE:
+        raise ValueError(f'limit must be between 1 and {CATALOG_MAX_PAGE_SIZE}')
+    return fields, limit
+
+
+def _product_catalog_etag(request):
+    """
+    Any product write bumps updated_at (stock movements included) and any
+    removal lowers the count, so together they version the catalog. One
+    aggregate over the (created_by, updated_at) partial index.
+    """
+    try:
+        fields, limit = _catalog_params(request)
+    except ValueError:
+        return None
+    catalog = Product.objects.filter(created_by=request.user, is_active=True).aggregate(
+        last_update=Max('updated_at'), count=Count('id'),
+    )
+    version = f"{catalog['last_update']}|{catalog['count']}|{','.join(fields)}|{limit}|{request.GET.get('cursor', '')}"
+    return hashlib.sha256(version.encode()).hexdigest()[:32]
+
+
+@login_required
+@condition(etag_func=_product_catalog_etag)
+def product_catalog_api(request):
+    """
+    Read-only JSON product catalog for POS sync - user-specific.
+
+    ?fields=id,name,sku picks the returned fields, ?limit= the page size and
+    ?cursor= continues from next_cursor of the previous page. Responses carry
+    an ETag; send it back in If-None-Match to get a 304 when nothing changed.
+    """
+    try:
+        fields, limit = _catalog_params(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    attributes = [CATALOG_FIELDS[name] for name in fields]
+    products = Product.objects.filter(created_by=request.user, is_active=True).only('id', *attributes)
+    page = KeysetPaginator(products, limit).get_page(request.GET.get('cursor'))
+
+    results = []
+    for product in page:
+        row = {}
+        for name, attribute in zip(fields, attributes):
+            value = getattr(product, attribute)
+            if name == 'image':
+                value = value.url if value else None
+            row[name] = value
+        results.append(row)
+
+    response = JsonResponse({'results': results, 'next_cursor': page.next_cursor})
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+# Most suggestions returned by product_lookup
+MAX_LOOKUP_RESULTS = 25
+
+
+@login_required
+def product_lookup(request):
+    """
+    Closest products to a possibly mistyped SKU or name, as JSON -
+    user-specific. Used by the product search box and the transaction form.
+    """
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), MAX_LOOKUP_RESULTS)
+    except ValueError:
+        limit = 10
+    products = similar_products(request.user, request.GET.get('q', ''), limit)
+    return JsonResponse({'results': [
+        {
+            'id': product.pk,
+            'name': product.name,
+            'sku': product.sku,
+            'quantity': product.quantity,
+            'similarity': round(product.similarity, 3),
+        }
+        for product in products
+    ]})
+
+
 @login_required
 def product_detail(request, pk):
     """Product detail view - user-specific"""
@@ -344,9 +450,25 @@ def transaction_create(request):
                 messages.error(request, 'You can only create transactions for your own products.')
                 form = TransactionForm(user=request.user)
                 return render(request, 'inventory/transaction_form.html', {'form': form, 'title': 'Process Transaction'})
-            transaction.save()
-            messages.success(request, 'Transaction processed successfully!')
-            return redirect('inventory:product_detail', pk=transaction.product.pk)
+
+            def save_transaction():
+                transaction.save()
+                return {'id': transaction.pk, 'product': transaction.product_id}
+
+            # Retries with the same key get the first result and move no stock
+            key = get_key(request, form.cleaned_data['idempotency_key'])
+            payload = {name: form.data.get(name) for name in form.Meta.fields}
+            try:
+                result, replayed = run_once(request.user, key, payload, save_transaction)
+            except IdempotencyKeyReused:
+                messages.error(request, 'This form was already submitted with different values.')
+                form = TransactionForm(user=request.user)
+                return render(request, 'inventory/transaction_form.html', {'form': form, 'title': 'Process Transaction'})
+            if replayed:
+                messages.info(request, 'Transaction was already processed.')
+            else:
+                messages.success(request, 'Transaction processed successfully!')
+            return redirect('inventory:product_detail', pk=result['product'])
     else:
         form = TransactionForm(user=request.user)
         product_id = request.GET.get('product')
@@ -362,6 +484,154 @@ def transaction_create(request):
     return render(request, 'inventory/transaction_form.html', {'form': form, 'title': 'Process Transaction'})
 
 
+@login_required
+@require_POST
+def transaction_bulk_create(request):
+    """
+    Create many transactions from a JSON array - user-specific.
+
+    Body: [{"product": id, "transaction_type": "IN", "quantity": 5,
+    "reference": "...", "notes": "..."}, ...]. The batch is all or nothing:
+    if any movement is invalid, nothing is saved and the errors are returned.
+    Session authenticated, so clients send the CSRF token in X-CSRFToken.
+    With an Idempotency-Key header, a retried request returns the original
+    response (marked with an Idempotent-Replayed header) and saves nothing.
+    """
+    try:
+        items = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Request body must be valid JSON.'}, status=400)
+    if not isinstance(items, list) or not items:
+        return JsonResponse({'error': 'Expected a non-empty JSON array of movements.'}, status=400)
+    if len(items) > MAX_BATCH_SIZE:
+        return JsonResponse({'error': f'At most {MAX_BATCH_SIZE} movements per request.'}, status=400)
+    
+    # A retry gets its original response even if the movements would no
+    # longer validate (e.g. the first request used up the stock)
+    key = get_key(request)
+    try:
+        result = replay(request.user, key, items)
+        replayed = result is not None
+        if not replayed:
+            transactions, errors = build_transactions(request.user, items)
+            if errors:
+                return JsonResponse({'errors': errors}, status=400)
+
+            def save_transactions():
+                post_transactions(transactions)
+                return {
+                    'created': len(transactions),
+                    'ids': [transaction.pk for transaction in transactions],
+                }
+
+            result, replayed = run_once(request.user, key, items, save_transactions)
+    except IdempotencyKeyReused:
+        return JsonResponse({'error': 'Idempotency-Key was already used for a different request.'}, status=422)
+    response = JsonResponse(result, status=201)
+    if replayed:
+        response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def _export_response(request, kind):
+    """Stream one of EXPORTS as CSV or XLSX (?format=xlsx)"""
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_CONTENT_TYPES:
+        return HttpResponseBadRequest('Unsupported export format.')
+    rows = EXPORTS[kind](request.user)
+    if export_format == 'xlsx':
+        content = xlsx_stream(rows, sheet_name=kind.title())
+    else:
+        content = csv_stream(rows)
+    response = StreamingHttpResponse(content, content_type=EXPORT_CONTENT_TYPES[export_format])
+    filename = f'{kind}-{timezone.localdate():%Y%m%d}.{export_format}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@login_required
+def product_export(request):
+    """Download all products as CSV or XLSX - user-specific"""
+    return _export_response(request, 'products')
+
+
+@login_required
+def transaction_export(request):
+    """Download all transactions, archived ones included, as CSV or XLSX - user-specific"""
+    return _export_response(request, 'transactions')
+
+
+@login_required
+def product_import(request):
+    """Create or update products from an uploaded CSV file - user-specific"""
+    if request.method == 'POST':
+        form = CSVImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            stream = io.TextIOWrapper(form.cleaned_data['file'].file, encoding='utf-8-sig', newline='')
+            try:
+                result = import_products_csv(request.user, stream)
+            except UnicodeDecodeError:
+                messages.error(request, 'The file is not valid UTF-8 text.')
+            except csv.Error as e:
+                messages.error(request, f'The file is not valid CSV ({e}).')
+            else:
+                messages.success(
+                    request, f'Created {result.created} and updated {result.updated} of {result.rows} products.'
+                )
+                if result.error_count:
+                    messages.warning(request, f'Skipped {result.error_count} invalid row(s).')
+                return render(request, 'inventory/product_import.html', {
+                    'form': CSVImportForm(),
+                    'result': result,
+                    'columns': PRODUCT_COLUMNS,
+                })
+    else:
+        form = CSVImportForm()
+
+    return render(request, 'inventory/product_import.html', {'form': form, 'columns': PRODUCT_COLUMNS})
+
+
+@login_required
+def transaction_import(request):
+    """Import transactions from an uploaded CSV file - user-specific"""
+    if request.method == 'POST':
+        form = CSVImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            # Parse the upload as a text stream instead of reading it into memory
+            stream = io.TextIOWrapper(form.cleaned_data['file'].file, encoding='utf-8-sig', newline='')
+            committed = 0
+
+            def track(result):
+                nonlocal committed
+                committed = result.imported
+
+            try:
+                result = import_transactions_csv(request.user, stream, progress=track)
+            except (UnicodeDecodeError, csv.Error) as e:
+                # Chunks before the unreadable part are already saved
+                problem = 'is not valid UTF-8 text' if isinstance(e, UnicodeDecodeError) else f'is not valid CSV ({e})'
+                messages.error(request, f'The file {problem}. {committed} row(s) before that point were imported.')
+            else:
+                messages.success(request, f'Imported {result.imported} of {result.rows} rows.')
+                if result.error_count:
+                    messages.warning(request, f'Skipped {result.error_count} invalid row(s).')
+                return render(request, 'inventory/transaction_import.html', {
+                    'form': CSVImportForm(),
+                    'result': result,
+                    'columns': TRANSACTION_COLUMNS,
+                })
+    else:
+        form = CSVImportForm()
+    
+    return render(request, 'inventory/transaction_import.html', {'form': form, 'columns': TRANSACTION_COLUMNS})
+
+
 @csrf_exempt
 def healthcheck(request):
     """
@@ -512,44 +782,41 @@ def is_superuser(user):
 @user_passes_test(is_superuser)
 def admin_user_report(request):
     """Admin-only view showing user statistics and activity"""
-    # Get all users with their statistics
-    users = User.objects.all().annotate(
-        products_count=Count('products', distinct=True),
-        categories_count=Count('categories', distinct=True),
-        suppliers_count=Count('suppliers', distinct=True),
-        transactions_count=Count('transactions', distinct=True),
-        active_products_count=Count('products', filter=Q(products__is_active=True), distinct=True),
-        low_stock_products_count=Count(
-            'products',
-            filter=Q(products__quantity__lte=F('products__reorder_level'), products__is_active=True),
-            distinct=True
-        ),
-        total_inventory_value=Sum(
-            F('products__quantity') * F('products__cost_price'),
-            filter=Q(products__is_active=True)
-        ),
-    ).order_by('-date_joined')
-    
-    # Calculate totals
-    total_users = users.count()
-    total_products = Product.objects.count()
-    total_categories = Category.objects.count()
-    total_suppliers = Supplier.objects.count()
-    total_transactions = Transaction.objects.count()
+    # Statistics are kept per user as inventory changes - nothing is counted here
+    stats = UserInventoryStats.objects.select_related('user')
+    
+    # Ordering - indexed columns only; newest users first by default
+    order_by = request.GET.get('order_by', '') or '-pk'
+    if order_by.lstrip('-') not in UserInventoryStats.ORDERINGS + ['pk']:
+        return HttpResponseBadRequest('Unsupported sort order.')
+    paginator = KeysetPaginator(stats, 50, order_by)  # 50 users per page
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    
+    # Sort order carried over by the previous/next links
+    page_query = request.GET.copy()
+    page_query.pop('cursor', None)
+    
+    # Calculate totals over the stats rows, one per user
+    totals = UserInventoryStats.objects.aggregate(
+        total_users=Count('pk'),
+        total_products=Sum('products_count'),
+        total_categories=Sum('categories_count'),
+        total_suppliers=Sum('suppliers_count'),
+        total_transactions=Sum('transactions_count'),
+    )
     
     # Get users with most activity
-    top_users_by_products = users.order_by('-products_count')[:5]
-    top_users_by_transactions = users.order_by('-transactions_count')[:5]
+    top_users_by_products = stats.filter(products_count__gt=0).order_by('-products_count', 'pk')[:5]
+    top_users_by_transactions = stats.filter(transactions_count__gt=0).order_by('-transactions_count', 'pk')[:5]
     
     context = {
-        'users': users,
-        'total_users': total_users,
-        'total_products': total_products,
-        'total_categories': total_categories,
-        'total_suppliers': total_suppliers,
-        'total_transactions': total_transactions,
+        'page_obj': page_obj,
+        'users': page_obj,
+        'order_by': order_by,
+        'page_query': page_query.urlencode(),
         'top_users_by_products': top_users_by_products,
         'top_users_by_transactions': top_users_by_transactions,
+        **{name: total or 0 for name, total in totals.items()},
     }
     
     return render(request, 'inventory/admin_user_report.html', context)
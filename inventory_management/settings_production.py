@@ -45,6 +45,19 @@ else:
         }
     }
 
+# Cache - gunicorn runs several workers, so a per-process memory cache would
+# miss invalidations made by other workers. Use the database unless Redis is set.
+# The table is created by python manage.py createcachetable, which every
+# start/release command (start.sh, render.yaml, Procfile, Dockerfile,
+# docker-compose.yml, .ebextensions) runs.
+if not os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'inventory_cache',
+        }
+    }
+
 # Security middleware settings
 SECURE_SSL_REDIRECT = os.environ.get('SECURE_SSL_REDIRECT', 'True') == 'True'
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
@@ -4,6 +4,10 @@ set -e
 # Use PORT if set by Railway, otherwise default to 8000
 PORT=${PORT:-8000}
 
+# Database cache table used by settings_production (no-op when it exists
+# or when another cache backend is configured)
+python manage.py createcachetable
+
 # Start gunicorn
 exec gunicorn inventory_management.wsgi:application \
     --bind "0.0.0.0:$PORT" \